@@ -1,21 +1,37 @@
 import asyncio
-import os, shlex, subprocess, sys, threading, time, io, csv
+import os, shlex, subprocess, sys, tempfile, threading, time, io
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
-from typing import Deque, Tuple, Optional, TypedDict, Dict, List
+from typing import Deque, Tuple, Optional, TypedDict, Dict, List, Union
 
+import numpy as np
 import serial
 import httpx
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import uuid
 
-from db.db_hooks import set_session_pipeline, get_session_pipeline, create_session, set_session_status, \
-    append_predictions_to_meta
+from db.db_hooks import append_session_samples, create_session, set_session_status, \
+    append_predictions, get_latest_predictions, get_session_history, compact_session_samples, iter_session_samples, \
+    iter_session_predictions, session_exists
 from utils.clear_data import clean_signal
 from utils.make_recommend import make_recommendations
-from utils.uterus_count import count_contractions
+from utils.uterus_count import ContractionDetector
+from utils.stream_buffer import ChannelBuffer
+from utils.spill_buffer import SpillBuffer
+from utils.ws_codec import CHANNELS, FORMAT_BINARY, FORMAT_JSON, encode_message
+from utils.downsample import MAX_POINTS, BucketReducer, quantize_points
+from utils import export as ex
+from utils.model_client import BreakerOpen, ModelClient
+from utils.embedded_model import EmbeddedModel
+from utils.line_parser import LineParser, chunk_times
+from utils.ingest_codec import IngestBatch, parse_body
+from utils.fhr_events import FhrEventDetector
+from utils.inference_scheduler import InferenceScheduler, PRIORITY_ALARM, PRIORITY_MANUAL, PRIORITY_ROUTINE
 
 # ==== конфигурация (жёстко, как просили) ====
 BPM_PORT = "COM13"
@@ -23,16 +39,49 @@ UTR_PORT = "COM15"
 BPM_EMU_PORT = "COM12"
 UTR_EMU_PORT = "COM14"
 BAUDRATE = 115200
-EMU_CMD = '{python} emulator.py {dataset} {number} --root .\\data --bpm-port ' + BPM_EMU_PORT + ' --uterus-port ' + UTR_EMU_PORT
+# как читать порты: asyncio — без потоков (fd в цикле событий, только POSIX),
+# thread — поток на порт, auto — asyncio везде, кроме Windows. Источники tcp://host:port — всегда asyncio.
+READER_MODE = "auto"
+TCP_RECONNECT_SEC = 1.0
+EMU_CMD = '{python} emulator.py {dataset} {number} --root .\\data --bpm-port {bpm_port} --uterus-port {uterus_port}'
+MAX_SESSIONS = 32         # сколько мониторов обслуживает один процесс
+INGEST_SEQ_WINDOW = 1024  # сколько последних пропущенных seq /ingest помнить, чтобы отличать опоздавший пакет от повтора
 WS_TICK_SEC = 0.1         # как часто слать буфер по WS
 DB_FLUSH_SEC = 10         # батч в БД
-EXTERNAL_FLUSH_SEC = 300.0  # 5 минут
-
+DB_QUEUE_MAX = 10000      # отсчётов в очереди на запись в БД
+DB_BATCH_MAX = 2000       # отсчётов в одном insert
+DB_BATCH_SEC = 2.0        # сколько ждать добора батча после первого отсчёта
+ARCHIVE_COMPRESSOR = "lzma"  # сжатие архива остановленной сессии: zlib | lzma
+EXTERNAL_FLUSH_SEC = 300.0  # 5 минут: плановый вызов модели, если не было вызовов по событиям
+ALARM_MIN_INTERVAL_SEC = 60.0  # вызовы по событиям сигнала — не чаще (на сессию)
+INFERENCE_CONCURRENCY = 4      # одновременных вызовов модели на все сессии
+CLEAN_CONTEXT_SEC = 5.0   # сколько предыдущего сигнала брать для очистки дельты
+CLEAN_HOLD_SEC = 0.8      # последние секунды канала не рассылаются, пока нет правого контекста
+                          # (окна clean_for_display: hampel_win 0.5 + ma_win 0.3)
+WS_CLIENT_QUEUE = 50      # кадров в очереди клиента (~5 с при WS_TICK_SEC=0.1)
+WS_SEND_TIMEOUT_SEC = 5.0 # клиент, не принявший кадр за это время, отключается
+TICK_WORKERS = 4          # потоков для очистки сигнала (тики /ws и снепшоты всех сессий)
+SNAPSHOT_RETRIES = 3      # попыток собрать снепшот в пуле, пока не сдвинулся seq
+LOOP_LAG_SEC = 0.5        # период замера задержки цикла событий
+
+SPILL_DIR = os.path.join(tempfile.gettempdir(), "ctg_spill")  # старая история каналов; None — всё в памяти
+SPILL_TAIL_SEC = 30 * 60  # сколько последних секунд канала держать в памяти (больше окна и горизонта модели)
 WINDOW_MINUTES = 3
 WINDOW_SECONDS = WINDOW_MINUTES * 60
 
 THRESHOLD = 0.5
 MODEL_API_URL = "http://localhost:9000/predict"
+MODEL_API_URLS = [MODEL_API_URL]  # реплики model_api: сессия закрепляется за наименее загруженной
+MODEL_HEALTH_SEC = 10.0           # период опроса /health реплик
+MODEL_ATTEMPT_TIMEOUT_SEC = 20.0  # одна попытка запроса к model_api
+MODEL_DEADLINE_SEC = 45.0         # весь вызов, включая повторы
+MODEL_RETRIES = 2
+MODEL_BREAKER_FAILURES = 3        # неудачных вызовов подряд до размыкания
+MODEL_BREAKER_RESET_SEC = 60.0    # через сколько пробовать снова
+INFERENCE_MODE = "http"           # http — MODEL_API_URLS | embedded — модели в пуле процессов бэкенда
+INFERENCE_WORKERS = 2             # процессов пула для embedded
+INFERENCE_HORIZON_MIN = 20       # сколько последних минут отправлять в модель (None — всю историю)
+MODEL_API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "model_api")
 
 class LabelInfo(TypedDict):
     proba: float
@@ -41,54 +90,147 @@ class LabelInfo(TypedDict):
 # ==== буферы окна ====
 @dataclass
 class StreamBuffers:
-    bpm: Deque[Tuple[float, float]]
-    uterus: Deque[Tuple[float, float]]
+    bpm: Union[ChannelBuffer, SpillBuffer]
+    uterus: Union[ChannelBuffer, SpillBuffer]
     window_seconds: float
     retain_all: bool = True
 
     def add(self, source: str, t: float, v: float) -> None:
         q = self.bpm if source == "bpm" else self.uterus
-        q.append((t, v))
+        q.append(t, v)
         if not self.retain_all:  # <— не режем историю, если включен retain_all
             self._drop_old()
 
-    def snapshot(self):
-        # копии списков для безопасной отдачи
-        return list(self.bpm), list(self.uterus), self.latest_time()
+    def extend(self, source: str, t: np.ndarray, v: np.ndarray) -> None:
+        """Пакет точек одного канала."""
+        q = self.bpm if source == "bpm" else self.uterus
+        q.extend(t, v)
+        if not self.retain_all:
+            self._drop_old()
+
+    def snapshot_window(self, seconds: Optional[float] = None):
+        """
+        Последние `seconds` секунд (по умолчанию window_seconds) обоих каналов.
+        Границы ищутся бинарным поиском; срезы (N, 2) без копирования.
+        """
+        latest = self.latest_time()
+        if seconds is None:
+            seconds = self.window_seconds
+        cutoff = max(0.0, latest - seconds)
+        return self.bpm.window(cutoff), self.uterus.window(cutoff), latest
+
+    def memory(self) -> dict:
+        """Байты в памяти и на диске по каналам."""
+        return {
+            name: {
+                "memory_bytes": ch.nbytes(),
+                "disk_bytes": ch.disk_bytes() if isinstance(ch, SpillBuffer) else 0,
+            }
+            for name, ch in (("bpm", self.bpm), ("uterus", self.uterus))
+        }
+
+    def close(self) -> None:
+        """Удаляет сегменты истории на диске (сессия остановлена, отсчёты уже в БД)."""
+        for ch in (self.bpm, self.uterus):
+            if isinstance(ch, SpillBuffer):
+                ch.close()
 
     def _drop_old(self) -> None:
         window_start = max(0.0, (self.latest_time() - self.window_seconds))
-        while self.bpm and self.bpm[0][0] < window_start:
-            self.bpm.popleft()
-        while self.uterus and self.uterus[0][0] < window_start:
-            self.uterus.popleft()
+        self.bpm.trim_before(window_start)
+        self.uterus.trim_before(window_start)
 
     def latest_time(self) -> float:
-        last_bpm = self.bpm[-1][0] if self.bpm else 0.0
-        last_uter = self.uterus[-1][0] if self.uterus else 0.0
-        return max(last_bpm, last_uter)
-
-    def snapshot_csv_files(self) -> Tuple[io.BytesIO, io.BytesIO]:
-        bpm_buf = io.StringIO()
-        uter_buf = io.StringIO()
-        bw = csv.writer(bpm_buf)
-        uw = csv.writer(uter_buf)
-        bw.writerow(["time", "value"])
-        uw.writerow(["time", "value"])
-        for t, v in self.bpm:
-            bw.writerow([t, v])
-        for t, v in self.uterus:
-            uw.writerow([t, v])
-        bpm_bytes = io.BytesIO(bpm_buf.getvalue().encode("utf-8"))
-        uter_bytes = io.BytesIO(uter_buf.getvalue().encode("utf-8"))
-        bpm_bytes.seek(0); uter_bytes.seek(0)
-        return bpm_bytes, uter_bytes
+        return max(self.bpm.last_time(), self.uterus.last_time())
+
+def make_buffers(session_id: uuid.UUID) -> StreamBuffers:
+    """Буферы сессии: с SPILL_DIR история старше SPILL_TAIL_SEC уходит в файлы сессии."""
+    if SPILL_DIR is None:
+        return StreamBuffers(ChannelBuffer(), ChannelBuffer(), WINDOW_SECONDS)
+    directory = os.path.join(SPILL_DIR, str(session_id))
+    return StreamBuffers(
+        SpillBuffer(directory, "bpm", tail_sec=SPILL_TAIL_SEC),
+        SpillBuffer(directory, "uterus", tail_sec=SPILL_TAIL_SEC),
+        WINDOW_SECONDS,
+    )
+
+def points_csv(points) -> bytes:
+    """Массив (N, 2) → CSV time,value (одним вызовом savetxt, без построчной записи)."""
+    buf = io.BytesIO()
+    np.savetxt(buf, points, fmt="%.6f", delimiter=",", header="time,value", comments="")
+    return buf.getvalue()
 
 # ==== БД-операции (используйте ваши из db_ops.py) ====
 # импортируйте готовые функции:
 
+# ==== клиент model_api: один на процесс ====
+model_client = ModelClient(
+    MODEL_API_URLS,
+    attempt_timeout_sec=MODEL_ATTEMPT_TIMEOUT_SEC,
+    deadline_sec=MODEL_DEADLINE_SEC,
+    retries=MODEL_RETRIES,
+    breaker_failures=MODEL_BREAKER_FAILURES,
+    breaker_reset_sec=MODEL_BREAKER_RESET_SEC,
+    health_interval_sec=MODEL_HEALTH_SEC,
+    max_connections=MAX_SESSIONS,
+)
+
+embedded_model = EmbeddedModel(MODEL_API_DIR, workers=INFERENCE_WORKERS)
+
+# ==== пул для очистки сигнала: фильтры на numpy отпускают GIL ====
+tick_pool = ThreadPoolExecutor(max_workers=TICK_WORKERS, thread_name_prefix="tick")
+
+@dataclass
+class LoopLagStats:
+    """Задержка цикла событий: насколько позже срока просыпается sleep(LOOP_LAG_SEC)."""
+    samples: int = 0
+    last: float = 0.0
+    max: float = 0.0
+    total: float = 0.0
+    over_tick: int = 0   # замеры с задержкой больше WS_TICK_SEC
+
+    def record(self, lag: float) -> None:
+        self.samples += 1
+        self.last = lag
+        self.max = max(self.max, lag)
+        self.total += lag
+        if lag > WS_TICK_SEC:
+            self.over_tick += 1
+
+    def stats(self) -> dict:
+        return {
+            "last_lag_sec": self.last,
+            "max_lag_sec": self.max,
+            "avg_lag_sec": self.total / self.samples if self.samples else 0.0,
+            "over_tick": self.over_tick,
+            "samples": self.samples,
+        }
+
+loop_lag = LoopLagStats()
+
+async def loop_lag_monitor():
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_SEC)
+        loop_lag.record(max(0.0, loop.time() - started - LOOP_LAG_SEC))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if INFERENCE_MODE == "embedded":
+        embedded_model.start()
+    else:
+        model_client.start()
+    lag_task = asyncio.create_task(loop_lag_monitor())
+    scheduler.start()
+    yield
+    lag_task.cancel()
+    await scheduler.stop()
+    await model_client.aclose()
+    embedded_model.shutdown()
+
 # ==== FastAPI ====
-app = FastAPI(title="Fetal Demo Backend")
+app = FastAPI(title="Fetal Demo Backend", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True,
@@ -97,23 +239,221 @@ app.add_middleware(
 
 
 
-# ==== глобальное состояние «одной» сессии ====
+# ==== состояние WS-потока: дельты с номерами ====
+@dataclass
+class WsStreamState:
+    seq: int = 0                                  # номер последнего отправленного сообщения
+    cursor: Dict[str, int] = field(default_factory=lambda: {"bpm": 0, "uterus": 0})  # абсолютные индексы
+    scalars: dict = field(default_factory=dict)   # последние отправленные скаляры
+    analytics_key: tuple = ()
+    reducers: Dict[int, BucketReducer] = field(default_factory=dict)  # прореживание по разрешениям
+
+@dataclass
+class WsClient:
+    """
+    Подписчик /ws с собственной очередью исходящих кадров: рассылка не ждёт
+    медленных клиентов. При переполнении очередь сбрасывается, и вместо
+    накопленных дельт клиент получит один свежий снепшот (coalesce).
+    """
+    fmt: str = FORMAT_JSON        # json | binary
+    points: Optional[int] = None  # целевое число точек на окно (None — без прореживания)
+    queue: Deque[Tuple[int, float, object]] = field(default_factory=deque)  # (seq, enqueued_at, кадр)
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    resync: bool = True           # первым уходит снепшот
+    task: Optional[asyncio.Task] = None
+    # метрики
+    sent: int = 0
+    dropped: int = 0              # кадры, выброшенные из переполненной очереди
+    skipped_while_resync: int = 0 # тики, пока клиент ждал снепшот: кадр не строился, данные уйдут снепшотом
+    snapshots: int = 0
+    bytes_sent: int = 0
+    lag: float = 0.0              # задержка последнего кадра в очереди, сек
+    max_lag: float = 0.0
+
+    def offer(self, seq: int, frame) -> None:
+        """Кладёт кадр в очередь без ожидания (вызывается из рассылки)."""
+        if self.resync:
+            self.skipped_while_resync += 1  # не потеря: всё уйдёт снепшотом
+        elif len(self.queue) >= WS_CLIENT_QUEUE:
+            self.dropped += len(self.queue) + 1
+            self.queue.clear()
+            self.resync = True
+        else:
+            self.queue.append((seq, time.monotonic(), frame))
+        self.wakeup.set()
+
+    def request_resync(self) -> None:
+        self.resync = True
+        self.wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "format": self.fmt,
+            "points": self.points,
+            "queued": len(self.queue),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "skipped_while_resync": self.skipped_while_resync,
+            "snapshots": self.snapshots,
+            "bytes_sent": self.bytes_sent,
+            "lag_sec": self.lag,
+            "max_lag_sec": self.max_lag,
+        }
+
+@dataclass
+class DbWriterStats:
+    """Метрики записи отсчётов в БД (очередь new_points_q → session_samples)."""
+    batches: int = 0
+    samples: int = 0
+    dropped: int = 0        # не влезли в очередь (дозаписываются из буфера)
+    lost: int = 0           # не нашлись и в буфере — в БД не попали
+    errors: int = 0
+    last_batch: int = 0
+    max_batch: int = 0
+    last_latency: float = 0.0  # сек на один insert
+    max_latency: float = 0.0
+    total_latency: float = 0.0
+
+    def record(self, n: int, latency: float) -> None:
+        self.batches += 1
+        self.samples += n
+        self.last_batch = n
+        self.max_batch = max(self.max_batch, n)
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.total_latency += latency
+
+    def stats(self, q: asyncio.Queue) -> dict:
+        return {
+            "queue_depth": q.qsize(),
+            "queue_max": q.maxsize,
+            "batches": self.batches,
+            "samples": self.samples,
+            "dropped": self.dropped,
+            "lost": self.lost,
+            "errors": self.errors,
+            "last_batch": self.last_batch,
+            "max_batch": self.max_batch,
+            "avg_batch": self.samples / self.batches if self.batches else 0.0,
+            "last_latency_sec": self.last_latency,
+            "max_latency_sec": self.max_latency,
+            "avg_latency_sec": self.total_latency / self.batches if self.batches else 0.0,
+        }
+
+@dataclass
+class InferenceStats:
+    """Метрики обращений к модели: размер окна и запроса, время сборки и вызова."""
+    calls: int = 0
+    last_samples: int = 0        # отсчётов в окне (оба канала)
+    last_request_bytes: int = 0  # размер тела (CSV) или массивов (embedded)
+    last_build_sec: float = 0.0  # срез окна + кодирование
+    last_call_sec: float = 0.0   # запрос к модели
+    total_request_bytes: int = 0
+    total_call_sec: float = 0.0
+
+    def record(self, samples: int, nbytes: int, build_sec: float, call_sec: float) -> None:
+        self.calls += 1
+        self.last_samples = samples
+        self.last_request_bytes = nbytes
+        self.last_build_sec = build_sec
+        self.last_call_sec = call_sec
+        self.total_request_bytes += nbytes
+        self.total_call_sec += call_sec
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "horizon_min": INFERENCE_HORIZON_MIN,
+            "last_samples": self.last_samples,
+            "last_request_bytes": self.last_request_bytes,
+            "last_build_sec": self.last_build_sec,
+            "last_call_sec": self.last_call_sec,
+            "avg_request_bytes": self.total_request_bytes / self.calls if self.calls else 0.0,
+            "avg_call_sec": self.total_call_sec / self.calls if self.calls else 0.0,
+        }
+
+@dataclass
+class TickStats:
+    """Тики рассылки /ws (очистка сигнала — в пуле потоков)."""
+    ticks: int = 0
+    overruns: int = 0          # тик пропущен: прошлый ещё не досчитан
+    stale: int = 0             # результат отброшен: курсор сдвинулся за время расчёта
+    snapshot_retries: int = 0  # снепшот пересобран: за время очистки ушла дельта
+    last_sec: float = 0.0
+    max_sec: float = 0.0
+    total_sec: float = 0.0
+
+    def record(self, sec: float) -> None:
+        self.ticks += 1
+        self.last_sec = sec
+        self.max_sec = max(self.max_sec, sec)
+        self.total_sec += sec
+
+    def stats(self) -> dict:
+        return {
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "stale": self.stale,
+            "snapshot_retries": self.snapshot_retries,
+            "last_tick_sec": self.last_sec,
+            "max_tick_sec": self.max_sec,
+            "avg_tick_sec": self.total_sec / self.ticks if self.ticks else 0.0,
+        }
+
+@dataclass
+class IngestState:
+    """Приём пакетов от удалённого монитора (/ingest): последний seq и счётчики."""
+    last_seq: int = -1
+    missing: set = field(default_factory=set)  # пропущенные seq не старше INGEST_SEQ_WINDOW от last_seq
+    batches: int = 0
+    duplicates: int = 0   # seq уже принят — пакет пропущен
+    gaps: int = 0         # пропущенные номера seq
+    late: int = 0         # пакет с пропущенным seq пришёл после более поздних
+    samples: int = 0
+    rejected: int = 0     # отсчёты раньше последнего в канале
+
+    def stats(self) -> dict:
+        return {
+            "last_seq": self.last_seq,
+            "batches": self.batches,
+            "duplicates": self.duplicates,
+            "gaps": self.gaps,
+            "late": self.late,
+            "samples": self.samples,
+            "rejected": self.rejected,
+        }
+
+# ==== состояние одной сессии (монитора) ====
 @dataclass
 class RuntimeCtx:
-    buffers: StreamBuffers = field(default_factory=lambda: StreamBuffers(deque(), deque(), WINDOW_SECONDS))
-    buffers_lock = asyncio.Lock()
-    new_points_q: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(maxsize=10000))  # для БД
-    ws_clients: set[WebSocket] = field(default_factory=set)
-    analytics = []
+    buffers: StreamBuffers = field(default_factory=lambda: StreamBuffers(ChannelBuffer(), ChannelBuffer(), WINDOW_SECONDS))
+    new_points_q: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(maxsize=DB_QUEUE_MAX))  # для БД
+    ws_clients: Dict[WebSocket, WsClient] = field(default_factory=dict)
+    analytics: list = field(default_factory=list)
+    contractions: ContractionDetector = field(default_factory=ContractionDetector)  # потоковый счётчик схваток
+    fhr: FhrEventDetector = field(default_factory=FhrEventDetector)  # сдвиг базальной линии, децелерации
+    triggers: Dict[str, int] = field(default_factory=dict)  # внеплановые вызовы модели по причинам
+    last_inference: float = 0.0  # monotonic последнего удачного вызова модели
+    ws_state: WsStreamState = field(default_factory=WsStreamState)
+    db_cursor: Dict[str, int] = field(default_factory=lambda: {"bpm": 0, "uterus": 0})  # записано в БД
+    db_stats: DbWriterStats = field(default_factory=DbWriterStats)
+    analytics_saved_ts: float = 0.0  # ts последнего события аналитики, уже записанного в БД
+    flush_skipped: int = 0                   # пропущенные обращения к model_api
+    inference_stats: InferenceStats = field(default_factory=InferenceStats)
+    ingest: IngestState = field(default_factory=IngestState)
+    tick_stats: TickStats = field(default_factory=TickStats)
+    last_flush_skip: Optional[str] = None    # и причина последнего пропуска
     # управление
     stop_evt: threading.Event = field(default_factory=threading.Event)
     proc: Optional[subprocess.Popen] = None
     threads: list[threading.Thread] = field(default_factory=list)
     t0: float = 0.0
     loop: Optional[asyncio.AbstractEventLoop] = None
+    ports: Tuple[str, ...] = ()  # занятые сессией COM-порты
 
     # фоновые задачи
     tasks: list[asyncio.Task] = field(default_factory=list)
+    tick_task: Optional[asyncio.Task] = None  # текущий тик рассылки /ws
 
     # идентификаторы
     session_id: Optional[uuid.UUID] = None
@@ -122,12 +462,60 @@ class RuntimeCtx:
     dataset: Optional[str] = None
     study_number: Optional[int] = None
 
-ctx = RuntimeCtx()
+    def info(self) -> dict:
+        return {
+            "session_id": str(self.session_id),
+            "user_name": self.user_name,
+            "dataset": self.dataset,
+            "study_number": self.study_number,
+            "ports": list(self.ports),
+            "elapsed": session_elapsed(self),
+            "ws_clients": len(self.ws_clients),
+            "points": {"bpm": self.buffers.bpm.total, "uterus": self.buffers.uterus.total},
+            "buffers": self.buffers.memory(),
+            "ingest": self.ingest.stats(),
+        }
+
+# ==== менеджер сессий: один процесс — много мониторов ====
+class SessionManager:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.sessions: Dict[uuid.UUID, RuntimeCtx] = {}
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def add(self, ctx: RuntimeCtx) -> None:
+        self.sessions[ctx.session_id] = ctx
+
+    def remove(self, session_id: uuid.UUID) -> Optional[RuntimeCtx]:
+        return self.sessions.pop(session_id, None)
+
+    def get(self, session_id: Optional[uuid.UUID] = None) -> RuntimeCtx:
+        """
+        Сессия по id. Без id — последняя запущенная (совместимость с
+        клиентами, которые работают с одним монитором).
+        """
+        if session_id is None:
+            if not self.sessions:
+                raise HTTPException(404, "no running sessions")
+            return next(reversed(self.sessions.values()))
+        ctx = self.sessions.get(session_id)
+        if ctx is None:
+            raise HTTPException(404, f"session {session_id} not found")
+        return ctx
+
+    def ports_in_use(self) -> set:
+        return {p for ctx in self.sessions.values() for p in ctx.ports}
+
+sessions = SessionManager(MAX_SESSIONS)
 
 # ========= помощники =========
 
-def spawn_emulator(dataset: str, number: int, *, cwd: Optional[str] = None) -> subprocess.Popen:
-    cmd_str = EMU_CMD.format(python=sys.executable, dataset=dataset, number=number)
+def spawn_emulator(dataset: str, number: int, bpm_port: str, uterus_port: str, *,
+                   cwd: Optional[str] = None) -> subprocess.Popen:
+    cmd_str = EMU_CMD.format(python=sys.executable, dataset=dataset, number=number,
+                             bpm_port=bpm_port, uterus_port=uterus_port)
     argv = shlex.split(cmd_str, posix=False) if os.name == "nt" else shlex.split(cmd_str)
     print(f"[emulator] {cmd_str}")
     proc = subprocess.Popen(argv, cwd=cwd or os.getcwd(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1, text=True)
@@ -151,172 +539,578 @@ def stop_emulator(proc: Optional[subprocess.Popen]):
     except subprocess.TimeoutExpired:
         proc.kill()
 
-def make_enqueue(loop: asyncio.AbstractEventLoop):
+def ingest_batch(ctx: RuntimeCtx, source: str, t: np.ndarray, v: np.ndarray) -> None:
     """
-    Возвращает функцию, которую можно дергать из потоков:
-    - добавляет точку в буфер
-    - кладёт её в очередь для БД
+    Пакет отсчётов канала (в потоке цикла событий):
+    - добавляет точки в буфер сессии
+    - обновляет счётчик схваток
+    - кладёт их в очередь для БД
     """
-    def enqueue(source: str, t: float, v: float):
-        def _do():
-            # print(source, t, v)
-            ctx.buffers.add(source, t, v)
-            try:
-                # channel, t, v
-                ctx.new_points_q.put_nowait((source, t, v))
-            except asyncio.QueueFull:
-                # дропаем «хвост» при перегрузе
-                pass
-        loop.call_soon_threadsafe(_do)
+    if len(t) == 0:
+        return
+    first = getattr(ctx.buffers, source).total
+    ctx.buffers.extend(source, t, v)
+    pairs = list(zip(t.tolist(), v.tolist()))
+    if source == "uterus":
+        before = ctx.contractions.count
+        ctx.contractions.extend(pairs)
+        if ctx.contractions.count > before:
+            trigger_inference(ctx, "contraction")
+    else:
+        for kind, _, _ in ctx.fhr.extend(pairs):
+            trigger_inference(ctx, kind)
+    for k, (ti, vi) in enumerate(pairs):
+        try:
+            # channel, абсолютный индекс, t, v
+            ctx.new_points_q.put_nowait((source, first + k, ti, vi))
+        except asyncio.QueueFull:
+            # при перегрузе точки остаются в буфере: писатель дозапишет их по разрыву индексов
+            ctx.db_stats.dropped += len(pairs) - k
+            break
+
+def trigger_inference(ctx: RuntimeCtx, reason: str) -> None:
+    """Событие на сигнале → внеочередной вызов модели (сливается и ограничивается планировщиком)."""
+    ctx.triggers[reason] = ctx.triggers.get(reason, 0) + 1
+    if ctx.session_id is not None:
+        scheduler.submit(ctx.session_id, PRIORITY_ALARM, reason)
+
+def make_enqueue(ctx: RuntimeCtx):
+    """
+    Возвращает функцию, которую можно дергать из потоков: пакет (t, v) канала
+    передаётся в цикл событий одним call_soon_threadsafe.
+    """
+    loop = ctx.loop
+
+    def enqueue(source: str, t: np.ndarray, v: np.ndarray):
+        loop.call_soon_threadsafe(ingest_batch, ctx, source, t, v)
     return enqueue
 
 def serial_reader_thread(port_name: str, baudrate: int, source: str,
-                         t0_monotonic: float, stop_evt: threading.Event, enqueue_point):
+                         t0_monotonic: float, stop_evt: threading.Event, enqueue_batch):
     try:
         ser = serial.Serial(port_name, baudrate=baudrate, timeout=0.1)
         print(f"[serial] opened {port_name} ({source})")
     except Exception as e:
         print(f"[serial] cannot open {port_name} ({source}): {e}")
         return
-    buf = bytearray()
+    parser = LineParser()
+    t_prev = 0.0
     try:
         while not stop_evt.is_set():
+            t_read = time.monotonic() - t0_monotonic
             try:
+                # копит до 1024 байт или timeout (0.1 с) — один пакет на чтение
                 chunk = ser.read(1024)
             except serial.SerialException as e:
                 print(f"[serial] read error {port_name}: {e}")
                 break
             if not chunk:
                 continue
-            buf.extend(chunk)
-            while b"\n" in buf:
-                line, _, rest = buf.partition(b"\n")
-                buf = bytearray(rest)
-                try:
-                    val = float(line.strip().decode("utf-8").rstrip("\r"))
-                except Exception:
-                    continue
-                t = time.monotonic() - t0_monotonic
-                enqueue_point(source, t, val)
+            vals = parser.feed(chunk)
+            if len(vals) == 0:
+                continue
+            # отсчёты куска пришли за время чтения: времена интерполируем равномерно
+            t, t_prev = chunk_times(len(vals), t_prev, t_read, time.monotonic() - t0_monotonic)
+            enqueue_batch(source, t, vals)
+    finally:
+        try: ser.close()
+        except Exception: pass
+        print(f"[serial] closed {port_name} ({source})")
+
+
+class ChunkIngest:
+    """
+    Разбор кусков одного канала и передача пакетов в буферы (в потоке цикла).
+    Один на канал на всё время сессии, в том числе через переподключения:
+    времена отсчётов не убывают (буферы и детекторы ищут по времени бинарно).
+    """
+
+    def __init__(self, ctx: RuntimeCtx, source: str):
+        self.ctx = ctx
+        self.source = source
+        self.parser = LineParser()
+        self.t_prev = 0.0  # время последнего отсчёта
+        self.t_wake = 0.0  # время предыдущего куска: отсчёты текущего пришли после него
+        self.reset()
+
+    def reset(self) -> None:
+        """Новое подключение: незавершённая строка прежнего теряется, отсчёты идут с этого момента."""
+        self.parser = LineParser()
+        self.t_wake = time.monotonic() - self.ctx.t0
+
+    def feed(self, chunk: bytes) -> None:
+        now = time.monotonic() - self.ctx.t0
+        vals = self.parser.feed(chunk)
+        if len(vals):
+            t_prev = max(self.t_prev, getattr(self.ctx.buffers, self.source).last_time())
+            t, self.t_prev = chunk_times(len(vals), t_prev, self.t_wake, now)
+            ingest_batch(self.ctx, self.source, t, vals)
+        self.t_wake = now
+
+async def serial_reader(ctx: RuntimeCtx, port_name: str, baudrate: int, source: str):
+    """
+    Чтение последовательного порта (или pty) без потоков: fd регистрируется
+    в цикле событий через loop.add_reader, данные читаются по готовности.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        ser = serial.Serial(port_name, baudrate=baudrate, timeout=0)
+        print(f"[serial] opened {port_name} ({source}, asyncio)")
+    except Exception as e:
+        print(f"[serial] cannot open {port_name} ({source}): {e}")
+        return
+    fd = ser.fileno()
+    ingest = ChunkIngest(ctx, source)
+    closed = loop.create_future()
+
+    def _on_readable():
+        try:
+            chunk = os.read(fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            print(f"[serial] read error {port_name}: {e}")
+            chunk = b""
+        if not chunk:  # порт закрыт с той стороны
+            loop.remove_reader(fd)
+            if not closed.done():
+                closed.set_result(None)
+            return
+        ingest.feed(chunk)
+
+    loop.add_reader(fd, _on_readable)
+    try:
+        await closed
     finally:
+        loop.remove_reader(fd)
         try: ser.close()
         except Exception: pass
         print(f"[serial] closed {port_name} ({source})")
 
+async def tcp_reader(ctx: RuntimeCtx, url: str, source: str):
+    """Источник tcp://host:port (преобразователь COM→TCP, удалённый монитор); переподключается при обрыве."""
+    host, _, port = url[len("tcp://"):].rpartition(":")
+    ingest = ChunkIngest(ctx, source)
+    while not ctx.stop_evt.is_set():
+        writer = None
+        try:
+            reader, writer = await asyncio.open_connection(host, int(port))
+            print(f"[tcp] connected {url} ({source})")
+            ingest.reset()
+            while True:
+                chunk = await reader.read(4096)
+                if not chunk:
+                    break
+                ingest.feed(chunk)
+            print(f"[tcp] closed by peer {url} ({source})")
+        except (OSError, ValueError) as e:
+            print(f"[tcp] {url} ({source}): {e}")
+        finally:
+            if writer is not None:
+                writer.close()
+        await asyncio.sleep(TCP_RECONNECT_SEC)
+
+def start_reader(ctx: RuntimeCtx, port: str, source: str) -> None:
+    """Запускает читателя канала: задачу asyncio или поток (см. READER_MODE)."""
+    if port.startswith("tcp://"):
+        ctx.tasks.append(asyncio.create_task(tcp_reader(ctx, port, source)))
+        return
+    use_asyncio = READER_MODE == "asyncio" or (READER_MODE == "auto" and os.name != "nt")
+    if use_asyncio:
+        ctx.tasks.append(asyncio.create_task(serial_reader(ctx, port, BAUDRATE, source)))
+        return
+    th = threading.Thread(
+        target=serial_reader_thread,
+        args=(port, BAUDRATE, source, ctx.t0, ctx.stop_evt, make_enqueue(ctx)),
+        daemon=True,
+    )
+    th.start()
+    ctx.threads.append(th)
 
-def snapshot_window(self, seconds: float | None = None):
-    bpm_list = list(self.bpm)
-    utr_list = list(self.uterus)
-    latest = self.latest_time()
-    if seconds is None:
-        return bpm_list, utr_list, latest
-    cutoff = max(0.0, latest - seconds)
-    # фильтрация по времени
-    bpm_win = [p for p in bpm_list if p[0] >= cutoff]
-    utr_win = [p for p in utr_list if p[0] >= cutoff]
-    return bpm_win, utr_win, latest
-
-def session_elapsed() -> float:
-    import time
+def session_elapsed(ctx: RuntimeCtx) -> float:
     return max(0.0, time.monotonic() - (ctx.t0 or 0.0))
 
 # ========= фоновые задачи =========
 
-async def ws_broadcaster():
-    print("[WS] broadcaster started")
-    tick = 0
-    while True:
-        try:
-            if not ctx.ws_clients:
-                await asyncio.sleep(WS_TICK_SEC)
+def clean_for_display(points):
+    return clean_signal(
+        points,
+        hampel_win=0.5,  # «иглы» длительностью <~0.5–1 c
+        hampel_sigma=3.0,  # чувствительность к выбросам
+        ma_win=0.3,  # лёгкое сглаживание
+        max_rate=80.0  # ограничение скорости (опционально)
+    )
+
+def current_scalars(ctx: RuntimeCtx) -> dict:
+    """Скалярные поля для клиента; в дельту попадают только изменившиеся."""
+    last_bpm = ctx.buffers.bpm.last()
+    last_utr = ctx.buffers.uterus.last()
+    return {
+        "heartRate": last_bpm[1] if last_bpm else 0,
+        "fetalMovement": last_utr[1] if last_utr else 0,
+        "contractions": ctx.contractions.count,
+    }
+
+def analytics_key(ctx: RuntimeCtx) -> tuple:
+    return (len(ctx.analytics), ctx.analytics[-1]["ts"] if ctx.analytics else None)
+
+def emit_end(ch: ChannelBuffer, cursor: int) -> int:
+    """
+    До какого абсолютного индекса канал можно разослать: точки старше последней
+    на CLEAN_HOLD_SEC уже имеют полное окно очистки справа. Не меньше cursor.
+    """
+    if not len(ch):
+        return cursor
+    return max(cursor, ch.abs_index(ch.last_time() - CLEAN_HOLD_SEC))
+
+def clean_slice(ch: ChannelBuffer, first_idx: int, lo_idx: int, hi_idx: int):
+    """
+    Вход очистки: (срез [first_idx, total) без копий, lo, hi) — точки [lo_idx, hi_idx)
+    лежат в срезе на [lo, hi); удержанные точки справа служат контекстом фильтров.
+    """
+    pts = ch.slice_abs(first_idx)
+    first = ch.total - len(pts)
+    return pts, max(0, lo_idx - first), max(0, hi_idx - first)
+
+def delta_context(ch: ChannelBuffer, start_idx: int, end_idx: int):
+    """Точки [start_idx, end_idx) с CLEAN_CONTEXT_SEC сигнала слева и удержанным хвостом справа."""
+    new = ch.slice_abs(start_idx, start_idx + 1)
+    first = ch.abs_index(float(new[0, 0]) - CLEAN_CONTEXT_SEC) if len(new) else start_idx
+    return clean_slice(ch, first, start_idx, end_idx)
+
+def clean_tails(raw: dict) -> dict:
+    """В пуле потоков: {канал: (срез, lo, hi)} → очищенные точки [lo, hi) канала."""
+    return {name: clean_for_display(pts)[lo:hi] if hi > lo else pts[:0] for name, (pts, lo, hi) in raw.items()}
+
+def snapshot_windows(ctx: RuntimeCtx) -> dict:
+    """Окна WINDOW_SECONDS каналов до курсора рассылки — в том же виде, что и delta_context."""
+    st = ctx.ws_state
+    out = {}
+    for name in CHANNELS:
+        ch, end = getattr(ctx.buffers, name), st.cursor[name]
+        last = ch.slice_abs(end - 1, end)
+        first = ch.abs_index(float(last[0, 0]) - WINDOW_SECONDS) if len(last) else end
+        out[name] = clean_slice(ch, first, first, end)
+    return out
+
+def build_snapshot(ctx: RuntimeCtx, points: Optional[int] = None, channels: Optional[dict] = None) -> dict:
+    """
+    Полный снепшот окна, согласованный с текущим seq: после него идут дельты seq+1, ...
+    points — прореживание min/max под разрешение клиента (общий BucketReducer на разрешение).
+    channels — окна, уже очищенные в пуле для этого seq (иначе очистка здесь же).
+    """
+    st = ctx.ws_state
+    if channels is None:
+        channels = clean_tails(snapshot_windows(ctx))
+    if points is not None:
+        reducer = st.reducers.get(points)
+        if reducer is None:
+            reducer = st.reducers[points] = BucketReducer(points, WINDOW_SECONDS)
+            reducer.seed(channels)
+        channels = {name: reducer.closed(a) for name, a in channels.items()}
+    return {
+        "type": "snapshot",
+        "session_id": str(ctx.session_id),
+        "seq": st.seq,
+        "window_seconds": WINDOW_SECONDS,
+        "elapsed": session_elapsed(ctx),
+        **channels,
+        **current_scalars(ctx),
+        "analytics": list(ctx.analytics),  # кодируется в пуле, пока цикл дописывает аналитику
+    }
+
+def delta_inputs(ctx: RuntimeCtx) -> Tuple[Dict[str, int], Dict[str, int], dict]:
+    """Начало тика (в цикле событий): (курсор, новый курсор, срезы для очистки)."""
+    st = ctx.ws_state
+    ends = {name: emit_end(getattr(ctx.buffers, name), st.cursor[name]) for name in CHANNELS}
+    raw = {}
+    for name, ch in (("bpm", ctx.buffers.bpm), ("uterus", ctx.buffers.uterus)):
+        if ends[name] > st.cursor[name]:
+            raw[name] = delta_context(ch, st.cursor[name], ends[name])
+    return dict(st.cursor), ends, raw
+
+def build_delta(ctx: RuntimeCtx, cursor: Dict[str, int], ends: Dict[str, int], channels: dict) -> Optional[dict]:
+    """
+    Дельта с прошлого тика: новые точки каналов (уже очищенные) и изменившиеся скаляры.
+    Если ничего не изменилось — None (тик ничего не отправляет).
+    Если курсор сдвинулся, пока шла очистка (skip_to_head), результат устарел — тоже None.
+    """
+    st = ctx.ws_state
+    if st.cursor != cursor:
+        ctx.tick_stats.stale += 1
+        return None
+    msg: dict = dict(channels)
+    scalars = current_scalars(ctx)
+    for k, v in scalars.items():
+        if st.scalars.get(k) != v:
+            msg[k] = v
+    akey = analytics_key(ctx)
+    if akey != st.analytics_key:
+        msg["analytics"] = ctx.analytics
+
+    st.cursor = ends
+    st.scalars = scalars
+    st.analytics_key = akey
+    if not msg:
+        return None
+    st.seq += 1
+    return {"type": "delta", "seq": st.seq, "elapsed": session_elapsed(ctx), **msg}
+
+def delta_variants(ctx: RuntimeCtx, msg: dict) -> Dict[Optional[int], dict]:
+    """Дельта для каждого используемого разрешения: новые точки сворачиваются в закрытые бакеты."""
+    variants: Dict[Optional[int], dict] = {None: msg}
+    channels = {name: msg[name] for name in CHANNELS if name in msg}
+    scalars = {k: v for k, v in msg.items() if k not in CHANNELS}
+    for points, reducer in ctx.ws_state.reducers.items():
+        variants[points] = {**scalars, **reducer.push(channels)}
+    return variants
+
+def skip_to_head(ctx: RuntimeCtx) -> None:
+    """Без клиентов дельты не копим: следующий клиент начнёт со снепшота."""
+    st = ctx.ws_state
+    st.reducers.clear()
+    st.cursor = {name: emit_end(getattr(ctx.buffers, name), st.cursor[name]) for name in CHANNELS}
+    st.scalars = current_scalars(ctx)
+    st.analytics_key = analytics_key(ctx)
+
+async def send_frame(ws: WebSocket, frame) -> None:
+    if isinstance(frame, bytes):
+        await ws.send_bytes(frame)
+    else:
+        await ws.send_text(frame)
+
+async def ws_sender(ctx: RuntimeCtx, ws: WebSocket, cl: WsClient):
+    """Отдельная задача на клиента: разбирает его очередь; медленный клиент тормозит только себя."""
+    try:
+        while True:
+            if not cl.queue and not cl.resync:
+                cl.wakeup.clear()
+                await cl.wakeup.wait()
                 continue
+            if cl.resync:
+                frame = await snapshot_frame(ctx, cl)
+                enqueued = time.monotonic()
+            else:
+                _, enqueued, frame = cl.queue.popleft()
+            await asyncio.wait_for(send_frame(ws, frame), WS_SEND_TIMEOUT_SEC)
+            cl.sent += 1
+            cl.bytes_sent += len(frame)
+            cl.lag = time.monotonic() - enqueued
+            cl.max_lag = max(cl.max_lag, cl.lag)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print("[WS] send failed -> drop client:", repr(e))
+        ctx.ws_clients.pop(ws, None)
+        try:
+            await ws.close()
+        except Exception:
+            pass
 
-            bpm, utr, latest = ctx.buffers.snapshot_window(ctx.buffers.window_seconds) \
-                if hasattr(ctx.buffers, "snapshot_window") else ctx.buffers.snapshot()
-
-            hr, fm = 0, 0
-            if len(bpm):
-                hr = bpm[-1][1]
-            if len(utr):
-                fm = utr[-1][1]
-
-            contractions = count_contractions(utr)
-
-            cleanedUtr = clean_signal(
-                utr,
-                hampel_win=0.5,  # «иглы» длительностью <~0.5–1 c
-                hampel_sigma=3.0,  # чувствительность к выбросам
-                ma_win=0.3,  # лёгкое сглаживание
-                max_rate=80.0  # ограничение скорости (опционально)
-            )
-
-            cleanedBpm = clean_signal(
-                bpm,
-                hampel_win=0.5,  # «иглы» длительностью <~0.5–1 c
-                hampel_sigma=3.0,  # чувствительность к выбросам
-                ma_win=0.3,  # лёгкое сглаживание
-                max_rate=80.0  # ограничение скорости (опционально)
-            )
-            analytics = ctx.analytics
-
-            payload = {
-                "type": "snapshot",
-                "elapsed": session_elapsed(),
-                "bpm": cleanedBpm,
-                "uterus": cleanedUtr,
-                "heartRate": hr,
-                "fetalMovement": fm,
-                "contractions": contractions,
-                "analytics": analytics
-            }
+async def snapshot_frame(ctx: RuntimeCtx, cl: WsClient):
+    """
+    Снепшот для клиента: окна очищаются в пуле. Если за это время ушла дельта (seq
+    сдвинулся), окна берутся заново; после SNAPSHOT_RETRIES попыток — очистка в цикле.
+    Пока cl.resync, дельты клиенту не копятся; флаг и очередь сбрасываются только
+    при снепшоте, согласованном с текущим seq.
+    """
+    loop = asyncio.get_running_loop()
+    snap = None
+    for _ in range(SNAPSHOT_RETRIES):
+        seq = ctx.ws_state.seq
+        channels = await loop.run_in_executor(tick_pool, clean_tails, snapshot_windows(ctx))
+        if ctx.ws_state.seq == seq:
+            snap = build_snapshot(ctx, cl.points, channels)
+            break
+        ctx.tick_stats.snapshot_retries += 1
+    if snap is None:
+        snap = build_snapshot(ctx, cl.points)
+    cl.resync = False
+    cl.queue.clear()  # всё из очереди уже вошло в снепшот
+    cl.snapshots += 1
+    return await loop.run_in_executor(tick_pool, encode_message, snap, cl.fmt)
+
+def broadcast_delta(ctx: RuntimeCtx, msg: dict) -> None:
+    variants = delta_variants(ctx, msg)
+    # кодируем один раз на (формат, разрешение), а не на клиента;
+    # отправка — в задачах ws_sender, здесь только очереди
+    encoded = {}
+    for cl in list(ctx.ws_clients.values()):
+        if cl.resync:
+            cl.offer(msg["seq"], None)  # ждёт снепшот: тик только учитывается в skipped_while_resync
+            continue
+        key = (cl.fmt, cl.points)
+        if key not in encoded:
+            encoded[key] = encode_message(variants[cl.points], cl.fmt)
+        cl.offer(msg["seq"], encoded[key])
+    # разрешения без клиентов больше не поддерживаем
+    used = {cl.points for cl in ctx.ws_clients.values()}
+    for points in list(ctx.ws_state.reducers):
+        if points not in used:
+            del ctx.ws_state.reducers[points]
+
+async def run_tick(ctx: RuntimeCtx) -> None:
+    """
+    Один тик рассылки: срезы берутся в цикле событий, очистка сигнала — в пуле
+    потоков, сборка дельты и раскладка по очередям клиентов — снова в цикле.
+    """
+    st = ctx.tick_stats
+    started = time.perf_counter()
+    try:
+        cursor, ends, raw = delta_inputs(ctx)
+        channels = await asyncio.get_running_loop().run_in_executor(tick_pool, clean_tails, raw) if raw else {}
+        msg = build_delta(ctx, cursor, ends, channels)
+        if msg is not None:
+            broadcast_delta(ctx, msg)
+    except Exception as e:
+        print("[WS] tick error:", e)
+    st.record(time.perf_counter() - started)
+
+async def ws_broadcaster(ctx: RuntimeCtx):
+    print(f"[WS] broadcaster started ({ctx.session_id})")
+    tick = 0
+    try:
+        while True:
+            try:
+                if not ctx.ws_clients:
+                    skip_to_head(ctx)
+                    await asyncio.sleep(WS_TICK_SEC)
+                    continue
 
-            dead = []
-            for ws in list(ctx.ws_clients):
-                try:
-                    await ws.send_json(payload)
-                except Exception as e:
-                    print("[WS] send failed -> drop client:", e)
-                    dead.append(ws)
-            for ws in dead:
-                ctx.ws_clients.discard(ws)
-
-            # простая диагностика раз в ~5 секунд
-            tick += 1
-            if tick % int(5 / WS_TICK_SEC) == 0:
-                print(f"[WS] sent snapshot to {len(ctx.ws_clients)} client(s); "
-                      f"bpm={len(bpm)} uter={len(utr)} latest={latest:.2f}")
+                # прошлый тик ещё считается — этот пропускаем, а не копим очередь
+                if ctx.tick_task is not None and not ctx.tick_task.done():
+                    ctx.tick_stats.overruns += 1
+                else:
+                    ctx.tick_task = asyncio.create_task(run_tick(ctx))
 
-        except Exception as e:
-            print("[WS] loop error:", e)
+                # простая диагностика раз в ~5 секунд
+                tick += 1
+                if tick % int(5 / WS_TICK_SEC) == 0:
+                    print(f"[WS] {ctx.session_id} seq={ctx.ws_state.seq} client(s)={len(ctx.ws_clients)} "
+                          f"bpm={ctx.buffers.bpm.total} uter={ctx.buffers.uterus.total} "
+                          f"latest={ctx.buffers.latest_time():.2f} overruns={ctx.tick_stats.overruns}")
+
+            except Exception as e:
+                print("[WS] loop error:", e)
 
-        await asyncio.sleep(WS_TICK_SEC)
+            await asyncio.sleep(WS_TICK_SEC)
+    finally:
+        if ctx.tick_task is not None:
+            ctx.tick_task.cancel()
+
+def channel_run(ctx: RuntimeCtx, name: str, items: list, end: Optional[int] = None):
+    """
+    Непрерывный отрезок канала для записи: (first_idx, points) или None.
+    Обычно это точки из очереди как есть. Если перед ними разрыв (дропы очереди,
+    неудачный прошлый insert), отрезок от курсора добирается из буфера;
+    то, чего нет и там, считается потерянным.
+    """
+    cursor = ctx.db_cursor[name]
+    if items:
+        idx0 = items[0][0]
+        end = items[-1][0] + 1
+        if idx0 == cursor and end - idx0 == len(items):
+            return cursor, np.array([(t, v) for _, t, v in items], dtype=np.float64)
+    if end is None or end <= cursor:
+        return None
+    pts = getattr(ctx.buffers, name).slice_abs(cursor, end)
+    first = end - len(pts)
+    ctx.db_stats.lost += first - cursor
+    return (first, pts) if len(pts) else None
+
+async def write_samples(ctx: RuntimeCtx, runs: dict) -> int:
+    """Один insert в session_samples; курсоры сдвигаются только после успеха."""
+    runs = {name: run for name, run in runs.items() if run is not None}
+    if not runs:
+        return 0
+    started = time.perf_counter()
+    written = await append_session_samples(ctx.session_id, runs)
+    ctx.db_stats.record(written, time.perf_counter() - started)
+    for name, (first, pts) in runs.items():
+        ctx.db_cursor[name] = first + len(pts)
+    return written
+
+async def next_batch(q: asyncio.Queue) -> list:
+    """
+    Ждёт первый отсчёт, затем добирает батч: не больше DB_BATCH_MAX отсчётов
+    и не дольше DB_BATCH_SEC.
+    """
+    items = [await q.get()]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + DB_BATCH_SEC
+    while len(items) < DB_BATCH_MAX:
+        try:
+            items.append(q.get_nowait())
+            continue
+        except asyncio.QueueEmpty:
+            pass
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        try:
+            items.append(await asyncio.wait_for(q.get(), remaining))
+        except asyncio.TimeoutError:
+            break
+    return items
 
-async def pipeline_writer():
+async def samples_writer(ctx: RuntimeCtx):
+    """Разбирает new_points_q батчами и дописывает отсчёты в session_samples."""
+    while not ctx.stop_evt.is_set():
+        items = await next_batch(ctx.new_points_q)
+        by_channel: Dict[str, list] = {name: [] for name in CHANNELS}
+        for source, idx, t, v in items:
+            by_channel[source].append((idx, t, v))
+        try:
+            await write_samples(ctx, {name: channel_run(ctx, name, it) for name, it in by_channel.items()})
+        except Exception as e:
+            # курсор не сдвинулся: эти точки уйдут следующим батчем через добор из буфера
+            ctx.db_stats.errors += 1
+            print("[samples_writer] error:", e)
+            await asyncio.sleep(DB_BATCH_SEC)
+
+async def persist_new_samples(ctx: RuntimeCtx) -> int:
+    """Дописывает всё, что есть в буфере после курсора (финальная запись при /stop)."""
+    while not ctx.new_points_q.empty():
+        ctx.new_points_q.get_nowait()
+    return await write_samples(ctx, {
+        name: channel_run(ctx, name, [], getattr(ctx.buffers, name).total) for name in CHANNELS
+    })
+
+async def persist_new_analytics(ctx: RuntimeCtx) -> int:
+    """Пишет в БД только события аналитики новее уже сохранённых (каждое — один раз)."""
+    fresh = [e for e in ctx.analytics if e["ts"] > ctx.analytics_saved_ts]
+    if not fresh:
+        return 0
+    written = await append_predictions(ctx.session_id, fresh)
+    ctx.analytics_saved_ts = max(e["ts"] for e in fresh)
+    return written
+
+async def pipeline_writer(ctx: RuntimeCtx):
 
     while not ctx.stop_evt.is_set():
         try:
             if ctx.session_id:
-                # ВАЖНО: берём полный срез буфера
-                bpm, utr, _ = ctx.buffers.snapshot()   # [[t,v], ...] для обоих каналов
-                await set_session_pipeline(
-                    ctx.session_id,
-                    bpm=bpm,
-                    uterus=utr,
-                    window_seconds=ctx.buffers.window_seconds,
-                )
-                analitycs = ctx.analytics
-                await append_predictions_to_meta(
-                    ctx.session_id, analitycs
-                )
+                await persist_new_analytics(ctx)
         except Exception as e:
             print("[pipeline_writer] error:", e)
         await asyncio.sleep(DB_FLUSH_SEC)
 
-async def external_flusher():
-    """Раз в 5 минут дергает внешнее API."""
+async def external_flusher(ctx: RuntimeCtx):
+    """
+    Плановый вызов модели: если её не вызывали EXTERNAL_FLUSH_SEC (вызовы по событиям
+    и /flush сдвигают срок). Идёт через общий планировщик с низшим приоритетом.
+    """
+    last_try = float("-inf")
     while not ctx.stop_evt.is_set():
+        due = max(ctx.last_inference, last_try) + EXTERNAL_FLUSH_SEC - time.monotonic()
+        if due > 0:
+            await asyncio.sleep(due)
+            continue
+        last_try = time.monotonic()
         try:
-            await flush_once()
+            await scheduler.request(ctx.session_id, PRIORITY_ROUTINE, "timer")
+        except BreakerOpen as e:
+            print("[external_flusher] skipped:", e.reason)
         except httpx.HTTPError as e:
             print("[external_flusher] http error:", e)
         except NotImplementedError:
@@ -324,7 +1118,6 @@ async def external_flusher():
             pass
         except Exception as e:
             print("[external_flusher] error:", e)
-        await asyncio.sleep(EXTERNAL_FLUSH_SEC)
 
 # ========= API =========
 
@@ -333,24 +1126,32 @@ class StartReq(BaseModel):
     user_name: str | None = None
     dataset: str           # "hypoxia" | "regular"
     study_number: int
+    # порты монитора; у каждой одновременной сессии — свои
+    bpm_port: str = BPM_PORT
+    uterus_port: str = UTR_PORT
+    bpm_emu_port: str = BPM_EMU_PORT
+    uterus_emu_port: str = UTR_EMU_PORT
+    emulate: bool = True   # запускать эмулятор на *_emu_port
+    remote: bool = False   # монитор шлёт данные в /ingest сам: портов и эмулятора нет
 
 
 
 @app.post("/start")
 async def start(req: StartReq):
-    if ctx.proc and ctx.proc.poll() is None:
-        await stop()
-        raise HTTPException(409, "session already running")
-    print('ok')
-    # очистка и инициализация
-    ctx.buffers = StreamBuffers(deque(), deque(), WINDOW_SECONDS)
-    ctx.buffers_lock = asyncio.Lock()
-    ctx.analytics = []
-    ctx.new_points_q = asyncio.Queue(maxsize=10000)
-    ctx.ws_clients.clear()
-    ctx.stop_evt.clear()
+    if len(sessions) >= sessions.capacity:
+        raise HTTPException(503, f"session capacity reached ({sessions.capacity})")
+    ports = () if req.remote else (req.bpm_port, req.uterus_port)
+    if req.emulate and not req.remote:
+        ports += (req.bpm_emu_port, req.uterus_emu_port)
+    busy = sessions.ports_in_use().intersection(ports)
+    if busy:
+        raise HTTPException(409, f"ports already in use: {sorted(busy)}")
+
+    # инициализация новой сессии
+    ctx = RuntimeCtx()
     ctx.t0 = time.monotonic()
-    ctx.loop = asyncio.get_event_loop()
+    ctx.loop = asyncio.get_running_loop()
+    ctx.ports = ports
     ctx.dataset = req.dataset
     ctx.study_number = req.study_number
     ctx.user_id = req.user_id
@@ -360,35 +1161,46 @@ async def start(req: StartReq):
     meta = {"user_name": req.user_name} if req.user_name else None
     sid = await create_session(req.user_id, req.dataset, req.study_number, meta=meta)
     ctx.session_id = sid
+    ctx.buffers = make_buffers(sid)
+    sessions.add(ctx)
 
     # 2) запускаем эмулятор
-    ctx.proc = spawn_emulator(req.dataset, req.study_number, cwd=os.getcwd())
-    # 3) поднимаем два читателя COM → буфер+очередь
-    enqueue = make_enqueue(ctx.loop)
-    th_bpm = threading.Thread(
-        target=serial_reader_thread,
-        args=(BPM_PORT, BAUDRATE, "bpm", ctx.t0, ctx.stop_evt, enqueue),
-        daemon=True,
-    )
-    th_utr = threading.Thread(
-        target=serial_reader_thread,
-        args=(UTR_PORT, BAUDRATE, "uterus", ctx.t0, ctx.stop_evt, enqueue),
-        daemon=True,
-    )
-    th_bpm.start(); th_utr.start()
-    ctx.threads = [th_bpm, th_utr]
-
-    # 4) фоновые задачи: WS broadcaster, DB flusher, external flusher
-    ctx.tasks = [
-        asyncio.create_task(ws_broadcaster()),
-        asyncio.create_task(pipeline_writer()),
-        asyncio.create_task(external_flusher()),
+    if req.emulate and not req.remote:
+        ctx.proc = spawn_emulator(req.dataset, req.study_number, req.bpm_emu_port, req.uterus_emu_port,
+                                  cwd=os.getcwd())
+    # 3) поднимаем два читателя COM/TCP → буфер+очередь (удалённый монитор шлёт в /ingest)
+    if not req.remote:
+        start_reader(ctx, req.bpm_port, "bpm")
+        start_reader(ctx, req.uterus_port, "uterus")
+
+    # 4) фоновые задачи: WS broadcaster, запись отсчётов и аналитики в БД, external flusher
+    ctx.tasks += [
+        asyncio.create_task(ws_broadcaster(ctx)),
+        asyncio.create_task(samples_writer(ctx)),
+        asyncio.create_task(pipeline_writer(ctx)),
+        asyncio.create_task(external_flusher(ctx)),
     ]
 
     return {"session_id": str(sid), "ok": True}
 
+archive_tasks: set = set()  # ссылки на фоновые задачи архивации
+
+async def archive_session(session_id: uuid.UUID) -> None:
+    try:
+        st = await compact_session_samples(session_id, ARCHIVE_COMPRESSOR)
+        if st["samples"]:
+            print(f"[archive] {session_id}: {st['samples']} samples, "
+                  f"{st['raw_bytes']} -> {st['archived_bytes']} bytes")
+    except Exception as e:
+        print(f"[archive] {session_id} failed:", e)
+
 @app.post("/stop")
-async def stop():
+async def stop(session_id: Optional[uuid.UUID] = None):
+    ctx = sessions.get(session_id)
+    sessions.remove(ctx.session_id)
+    scheduler.forget(ctx.session_id)
+    model_client.forget(ctx.session_id)
+
     # гасим задачи
     ctx.stop_evt.set()
     for t in ctx.tasks:
@@ -404,54 +1216,368 @@ async def stop():
     stop_emulator(ctx.proc)
     ctx.proc = None
 
+    # отключаем подписчиков сессии
+    for ws, cl in list(ctx.ws_clients.items()):
+        if cl.task:
+            cl.task.cancel()
+        try:
+            await ws.close()
+        except Exception:
+            pass
+    ctx.ws_clients.clear()
+
     if ctx.session_id:
+        # дописываем хвост, который samples_writer не успел забрать из очереди
+        try:
+            await persist_new_samples(ctx)
+        except Exception as e:
+            print("[stop] final samples write failed:", e)
+        try:
+            await persist_new_analytics(ctx)
+        except Exception as e:
+            print("[stop] final analytics write failed:", e)
         await set_session_status(ctx.session_id, "stopped")
+        ctx.buffers.close()
+        # архивируем отсчёты в фоне, ответ /stop не ждёт
+        task = asyncio.create_task(archive_session(ctx.session_id))
+        archive_tasks.add(task)
+        task.add_done_callback(archive_tasks.discard)
 
-    return {"ok": True}
+    return {"ok": True, "session_id": str(ctx.session_id)}
+
+def apply_ingest(ctx: RuntimeCtx, batches: List[IngestBatch]) -> dict:
+    """
+    Пакеты удалённого монитора → те же буферы, рассылка и запись в БД, что и у COM-портов.
+    Пакет с seq не больше последнего принятого — повтор, пропускается, если этот seq
+    не был пропущен. Пропущенный seq, пришедший позже (ретрай после таймаута), — late:
+    его отсчёты проходят обычную проверку по времени, так что более ранние, чем уже
+    принятые, отбрасываются; номера таких пакетов возвращаются в late_seqs.
+    Отсчёты каждого канала сортируются; более ранние, чем уже принятые, и нечисловые
+    (NaN/inf — парсер их не пропускает, но буфер без них не восстановится) отбрасываются.
+    """
+    st = ctx.ingest
+    accepted = samples = 0
+    late_seqs = []
+    for b in batches:
+        if b.seq is not None:
+            if b.seq <= st.last_seq:
+                if b.seq not in st.missing:
+                    st.duplicates += 1
+                    continue
+                st.missing.discard(b.seq)
+                st.late += 1
+                late_seqs.append(b.seq)
+            else:
+                if st.last_seq >= 0 and b.seq > st.last_seq + 1:
+                    st.gaps += b.seq - st.last_seq - 1
+                    st.missing.update(range(max(st.last_seq + 1, b.seq - INGEST_SEQ_WINDOW), b.seq))
+                st.last_seq = b.seq
+                if len(st.missing) > INGEST_SEQ_WINDOW:
+                    st.missing = {seq for seq in st.missing if seq >= b.seq - INGEST_SEQ_WINDOW}
+        for name, (t, v) in b.channels.items():
+            order = np.argsort(t, kind="stable")
+            t, v = t[order], v[order]
+            ch = getattr(ctx.buffers, name)
+            keep = np.isfinite(t) & np.isfinite(v)
+            if len(ch):
+                keep &= t >= ch.last_time()
+            st.rejected += int(len(t) - keep.sum())
+            ingest_batch(ctx, name, t[keep], v[keep])
+            samples += int(keep.sum())
+        st.batches += 1
+        accepted += 1
+    st.samples += samples
+    return {"accepted": accepted, "samples": samples, "last_seq": st.last_seq, "late_seqs": late_seqs, **{
+        k: v for k, v in st.stats().items() if k in ("duplicates", "gaps", "late", "rejected")
+    }}
+
+@app.post("/ingest")
+async def ingest(request: Request, session_id: Optional[uuid.UUID] = None):
+    """
+    Пакеты отсчётов удалённого монитора: NDJSON (по пакету на строку) или бинарный
+    кадр CTG1 (utils/ingest_codec.py). Идемпотентно по seq.
+    """
+    ctx = sessions.get(session_id)
+    body = await request.body()
+    try:
+        batches = parse_body(body)
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(400, f"bad ingest payload: {e}")
+    return {"session_id": str(ctx.session_id), **apply_ingest(ctx, batches)}
+
+@app.websocket("/ingest/ws")
+async def ingest_ws(ws: WebSocket):
+    """
+    Поток пакетов по WS (/ingest/ws?session_id=...): каждое сообщение — NDJSON-текст
+    или бинарный кадр; на каждое приходит {"type": "ack", "last_seq": ..., ...}.
+    """
+    await ws.accept()
+    try:
+        sid = ws.query_params.get("session_id")
+        ctx = sessions.get(uuid.UUID(sid) if sid else None)
+    except (ValueError, HTTPException) as e:
+        await ws.close(code=4404, reason=str(getattr(e, "detail", e)))
+        return
+    try:
+        while True:
+            msg = await ws.receive()
+            if msg["type"] == "websocket.disconnect":
+                break
+            body = msg.get("bytes") or (msg.get("text") or "").encode("utf-8")
+            try:
+                res = apply_ingest(ctx, parse_body(body))
+                await ws.send_json({"type": "ack", **res})
+            except (ValueError, KeyError, TypeError) as e:
+                await ws.send_json({"type": "error", "detail": str(e), "last_seq": ctx.ingest.last_seq})
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/health")
+async def health():
+    """Живость процесса и задержка цикла событий."""
+    return {"ok": True, "sessions": len(sessions), "loop": loop_lag.stats()}
+
+@app.get("/sessions")
+async def list_sessions():
+    """Активные сессии процесса."""
+    return {
+        "capacity": sessions.capacity,
+        "sessions": [ctx.info() for ctx in sessions.sessions.values()],
+    }
+
+@app.get("/sessions/{session_id}/predictions")
+async def session_predictions(session_id: uuid.UUID, limit: int = Query(50, ge=1, le=1000)):
+    """Последние limit событий аналитики сессии из БД (работает и для остановленных сессий)."""
+    return {
+        "session_id": str(session_id),
+        "events": await get_latest_predictions(session_id, limit),
+    }
+
+@app.get("/sessions/{session_id}/history")
+async def session_history(
+    session_id: uuid.UUID,
+    t_from: Optional[float] = Query(None, alias="from"),
+    t_to: Optional[float] = Query(None, alias="to"),
+    points: int = Query(1000, ge=10, le=MAX_POINTS),
+):
+    """
+    История сессии из БД за [from, to] (сек от старта) не больше чем в ~points точках
+    на канал. Длинные диапазоны читаются из сводок 1/10/60 с (min/max/mean),
+    короткие — сырыми отсчётами; level в ответе — длина бакета (0 — сырые).
+    """
+    return {
+        "session_id": str(session_id),
+        "from": t_from,
+        "to": t_to,
+        **{name: await get_session_history(session_id, name, t_from, t_to, points) for name in CHANNELS},
+    }
+
+async def export_samples(session_id: uuid.UUID, fmt: str, channels: Tuple[str, ...]):
+    # число отсчётов и сами чанки — из одного снимка БД (для npy размер нужен заранее)
+    rows = iter_session_samples(session_id, channels)
+    pq = ex.ParquetStream("samples") if fmt == "parquet" else None
+    try:
+        counts = await anext(rows)
+        if fmt == "npy":
+            yield ex.samples_npy_header(sum(counts.values()))
+        elif fmt == "csv":
+            yield ex.samples_csv_header()
+        async for name, pts in rows:
+            if pq:
+                out = pq.push_samples(name, pts)
+            elif fmt == "npy":
+                out = ex.samples_npy(name, pts)
+            else:
+                out = ex.samples_csv(name, pts)
+            if out:
+                yield out
+    finally:
+        await rows.aclose()  # клиент мог уйти посреди выгрузки — транзакция снимка закрывается сразу
+    if pq:
+        yield pq.close()
+
+async def export_predictions(session_id: uuid.UUID, fmt: str):
+    pq = ex.ParquetStream("predictions") if fmt == "parquet" else None
+    if not pq:
+        yield ex.predictions_csv_header()
+    async for events in iter_session_predictions(session_id):
+        out = pq.push_predictions(events) if pq else ex.predictions_csv(events)
+        if out:
+            yield out
+    if pq:
+        yield pq.close()
+
+@app.get("/sessions/{session_id}/export")
+async def session_export(
+    session_id: uuid.UUID,
+    format: str = Query("csv"),
+    data: str = Query("samples"),
+    channel: Optional[str] = Query(None),
+):
+    """
+    Потоковая выгрузка сессии из БД: data=samples (отсчёты) | predictions (события аналитики),
+    format=csv | parquet | npy (npy — только отсчёты), channel=bpm | uterus (по умолчанию оба).
+    Данные читаются серверным курсором и кодируются по чанкам.
+    """
+    if format not in ex.EXPORT_FORMATS:
+        raise HTTPException(400, f"format must be one of {ex.EXPORT_FORMATS}")
+    if data not in ("samples", "predictions"):
+        raise HTTPException(400, "data must be samples or predictions")
+    if data == "predictions" and format == "npy":
+        raise HTTPException(400, "npy export is available for samples only")
+    if channel is not None and channel not in CHANNELS:
+        raise HTTPException(400, f"channel must be one of {CHANNELS}")
+    if format == "parquet" and not ex.parquet_available():
+        raise HTTPException(501, "parquet export requires pyarrow")
+    if not await session_exists(session_id):
+        raise HTTPException(404, f"session {session_id} not found")
+
+    if data == "samples":
+        body = export_samples(session_id, format, (channel,) if channel else CHANNELS)
+    else:
+        body = export_predictions(session_id, format)
+    filename = ex.export_filename(str(session_id), data, format, channel if data == "samples" else None)
+    return StreamingResponse(body, media_type=ex.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 @app.websocket("/ws")
 async def ws(ws: WebSocket):
+    """
+    Протокол: при подключении — "snapshot" (окно + seq), далее "delta"
+    с seq+1, seq+2, ... (только новые точки и изменившиеся поля).
+    При пропуске seq клиент шлёт {"type": "resync"} и получает новый снепшот.
+    /ws?session_id=... — подписка на конкретную сессию (по умолчанию — последняя запущенная).
+    /ws?format=binary — бинарные кадры (utils/ws_codec.py), иначе JSON.
+    /ws?points=N — каналы прорежены min/max до ~N точек на окно.
+    """
     await ws.accept()
-    ctx.ws_clients.add(ws)
-    print(f"[WS] connected; clients={len(ctx.ws_clients)}")
-
-    # отправим начальный снепшот сразу
     try:
-        bpm, utr, latest = ctx.buffers.snapshot_window(ctx.buffers.window_seconds) \
-            if hasattr(ctx.buffers, "snapshot_window") else ctx.buffers.snapshot()
-        await ws.send_json({
-            "type": "snapshot",
-            "latest_time": latest,
-            "bpm": bpm,
-            "uterus": utr,
-        })
-    except Exception as e:
-        print("[WS] initial send failed:", e)
+        sid = ws.query_params.get("session_id")
+        ctx = sessions.get(uuid.UUID(sid) if sid else None)
+    except (ValueError, HTTPException) as e:
+        await ws.close(code=4404, reason=str(getattr(e, "detail", e)))
+        return
+
+    fmt = FORMAT_BINARY if ws.query_params.get("format") == FORMAT_BINARY else FORMAT_JSON
+    points = ws.query_params.get("points")
+    cl = WsClient(fmt=fmt, points=quantize_points(int(points)) if points and points.isdigit() else None)
+    ctx.ws_clients[ws] = cl
+    # начальный снепшот уйдёт первым кадром из очереди (cl.resync=True)
+    cl.task = asyncio.create_task(ws_sender(ctx, ws, cl))
+    print(f"[WS] connected to {ctx.session_id} ({cl.fmt}, points={cl.points}); clients={len(ctx.ws_clients)}")
 
     try:
         while True:
-            await asyncio.sleep(60)
+            msg = await ws.receive_json()
+            if isinstance(msg, dict) and msg.get("type") == "resync":
+                cl.request_resync()
     except WebSocketDisconnect:
         pass
+    except Exception as e:
+        print("[WS] receive error:", e)
     finally:
-        ctx.ws_clients.discard(ws)
-        print(f"[WS] disconnected; clients={len(ctx.ws_clients)}")
+        ctx.ws_clients.pop(ws, None)
+        cl.task.cancel()
+        print(f"[WS] disconnected from {ctx.session_id}; clients={len(ctx.ws_clients)}")
+
+@app.get("/db/stats")
+async def db_stats(session_id: Optional[uuid.UUID] = None):
+    """Метрики записи отсчётов сессии в БД: глубина очереди, батчи, задержка, дропы."""
+    ctx = sessions.get(session_id)
+    return {
+        "session_id": str(ctx.session_id),
+        "written": dict(ctx.db_cursor),
+        **ctx.db_stats.stats(ctx.new_points_q),
+    }
+
+@app.get("/model/stats")
+async def model_stats():
+    """Состояние клиента model_api: предохранитель, попытки, ошибки, пропуски по сессиям."""
+    return {
+        **model_client.stats(),
+        "scheduler": scheduler.stats(),
+        "sessions": {
+            str(ctx.session_id): {
+                "replica": model_client.replica_of(ctx.session_id),
+                "triggers": dict(ctx.triggers),
+                "skipped": ctx.flush_skipped,
+                "last_skip_reason": ctx.last_flush_skip,
+                **ctx.inference_stats.stats(),
+            }
+            for ctx in sessions.sessions.values()
+        },
+    }
+
+@app.get("/ws/stats")
+async def ws_stats(session_id: Optional[uuid.UUID] = None):
+    """Метрики подписчиков /ws сессии: очередь, отставание, сброшенные кадры."""
+    ctx = sessions.get(session_id)
+    return {
+        "session_id": str(ctx.session_id),
+        "seq": ctx.ws_state.seq,
+        "ticks": ctx.tick_stats.stats(),
+        "loop": loop_lag.stats(),
+        "clients": [
+            {"client": f"{ws.client.host}:{ws.client.port}" if ws.client else None, **cl.stats()}
+            for ws, cl in ctx.ws_clients.items()
+        ],
+    }
 
 
 
-async def flush_once():
-    print('flush')
-    async with ctx.buffers_lock:
-        bpm_file, uter_file = ctx.buffers.snapshot_csv_files()
+async def inference_window(ctx: RuntimeCtx):
+    """
+    Последние INFERENCE_HORIZON_MIN минут каждого канала (срезы буфера, без копий).
+    Лок не нужен: в буферы пишет только цикл событий (потоки чтения портов передают
+    пакеты через call_soon_threadsafe), а поиск границ идёт без await. Буфер только
+    дописывается, и рост выделяет новый массив, поэтому выданные срезы не меняются,
+    пока CSV собирается в потоке.
+    """
+    horizon = float("inf") if INFERENCE_HORIZON_MIN is None else INFERENCE_HORIZON_MIN * 60
+    bpm, uterus, _ = ctx.buffers.snapshot_window(horizon)
+    return bpm, uterus
+
+async def predict_remote(ctx: RuntimeCtx) -> dict:
+    """Окно → CSV → model_api /predict по HTTP."""
+    started = time.perf_counter()
+    bpm, uterus = await inference_window(ctx)
+    bpm_csv, uterus_csv = await asyncio.to_thread(lambda: (points_csv(bpm), points_csv(uterus)))
+    # bytes, а не файлы: при повторе тело отправляется заново
     files = {
-        "bpm": ("bpm.csv", bpm_file, "text/csv"),
-        "uterus": ("uterus.csv", uter_file, "text/csv"),
+        "bpm": ("bpm.csv", bpm_csv, "text/csv"),
+        "uterus": ("uterus.csv", uterus_csv, "text/csv"),
     }
     params = {"threshold": THRESHOLD}
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(MODEL_API_URL, files=files, params=params)
-        r.raise_for_status()
-        data = r.json()
+    built = time.perf_counter()
+    try:
+        r = await model_client.post(key=ctx.session_id, files=files, params=params)
+    except BreakerOpen as e:
+        ctx.flush_skipped += 1
+        ctx.last_flush_skip = e.reason
+        raise
+    ctx.inference_stats.record(len(bpm) + len(uterus), len(bpm_csv) + len(uterus_csv),
+                               built - started, time.perf_counter() - built)
+    r.raise_for_status()
+    return r.json()
+
+async def predict_embedded(ctx: RuntimeCtx) -> dict:
+    """Окно → признаки + CatBoost в пуле процессов, на массивах."""
+    started = time.perf_counter()
+    bpm, uterus = await inference_window(ctx)
+    # копии: пул передаёт аргументы в процесс позже, уже после выхода из функции
+    bpm, uterus = bpm[:, 1].copy(), uterus[:, 1].copy()
+    built = time.perf_counter()
+    data = await embedded_model.predict(bpm, uterus, THRESHOLD)
+    ctx.inference_stats.record(len(bpm) + len(uterus), bpm.nbytes + uterus.nbytes,
+                               built - started, time.perf_counter() - built)
+    return data
+
+async def flush_once(ctx: RuntimeCtx):
+    print(f'flush {ctx.session_id}')
+    if INFERENCE_MODE == "embedded":
+        data = await predict_embedded(ctx)
+    else:
+        data = await predict_remote(ctx)
 
     # берём только predictions
     preds = data.get("predictions", {})
@@ -465,22 +1591,36 @@ async def flush_once():
         "ts": time.time(),                # unix сек
         "predictions": formatted,             # ровно то, что нужно
     }
-    async with ctx.buffers_lock:
-        ctx.analytics.append(event)
-        # (опционально: ограничить длину истории)
-        if len(ctx.analytics) > 500:
-            ctx.analytics = ctx.analytics[-500:]
+    ctx.analytics.append(event)
+    # (опционально: ограничить длину истории)
+    if len(ctx.analytics) > 500:
+        ctx.analytics = ctx.analytics[-500:]
 
+    ctx.last_inference = time.monotonic()
     print(preds)
     return preds
 
+async def run_scheduled(session_id: uuid.UUID):
+    """Вызов модели для запроса из очереди планировщика."""
+    ctx = sessions.sessions.get(session_id)
+    if ctx is None:  # сессию успели остановить
+        return None
+    return await flush_once(ctx)
+
+# ==== планировщик вызовов модели: один на процесс ====
+scheduler = InferenceScheduler(run_scheduled, workers=INFERENCE_CONCURRENCY,
+                               min_interval_sec=ALARM_MIN_INTERVAL_SEC)
+
 
 @app.post("/flush")
-async def flush_now():
+async def flush_now(session_id: Optional[uuid.UUID] = None):
+    ctx = sessions.get(session_id)
     try:
-        data = await flush_once()
+        data = await scheduler.request(ctx.session_id, PRIORITY_MANUAL, "manual")
         return {"status": "ok", "result": data}
+    except BreakerOpen as e:
+        raise HTTPException(status_code=503, detail=e.reason)
     except httpx.HTTPError as e:
         raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -7,7 +7,10 @@ from sqlalchemy import text, bindparam
 from sqlalchemy.dialects.postgresql import JSONB, UUID as PGUUID
 
 import json
+import numpy as np
 from .db_config import ASYNC_DSN
+from utils.rollup import ROLLUP_LEVELS, bucket_stats, merge_buckets, choose_level, to_series
+from utils.archive_codec import encode_points, decode_points, quantize, TIME_RESOLUTION, VALUE_RESOLUTION
 
 
 engine = create_async_engine(ASYNC_DSN, pool_size=5, max_overflow=5)
@@ -40,79 +43,422 @@ async def create_session(user_id: uuid.UUID, dataset: str, study_number: int, me
         await s.commit()
         return sid
 
+async def session_exists(session_id: uuid.UUID) -> bool:
+    q = text("select exists(select 1 from sessions where id = :sid)")
+    async with SessionMaker() as s:
+        return bool((await s.execute(q, {"sid": session_id})).scalar())
+
 async def set_session_status(session_id: uuid.UUID, status: str) -> None:
     q = text("select set_session_status(:sid, :st)")
     async with SessionMaker() as s:
         await s.execute(q, {"sid": session_id, "st": status})
         await s.commit()
 
-async def append_predictions_to_meta(session_id: uuid.UUID, predictions: List[Any]) -> None:
+async def append_predictions(session_id: uuid.UUID, events: Sequence[dict]) -> int:
     """
-    Добавляет событие в sessions.meta.analytics:
-      { "ts": <epoch_seconds>, "predictions": [ ... ] }
+    Сохраняет события аналитики {"ts": <epoch_seconds>, "predictions": [...]}
+    в session_predictions, по строке на событие. Ключ — (session_id, ts),
+    повторная запись того же события игнорируется.
     """
+    if not events:
+        return 0
     q = (
         text("""
-            UPDATE sessions
-            SET meta = jsonb_set(
-                COALESCE(meta, '{}'::jsonb),
-                '{analytics}',
-                COALESCE(meta->'analytics','[]'::jsonb) ||
-                to_jsonb(
-                  jsonb_build_object(
-                    'ts', extract(epoch from now()),
-                    'predictions', :preds
-                  )
-                ),
-                true
-            )
-            WHERE id = :sid
+            insert into session_predictions (session_id, ts, predictions)
+            values (:sid, :ts, :preds)
+            on conflict do nothing
         """)
         .bindparams(bindparam("preds", type_=JSONB))
     )
-    params = {"sid": session_id, "preds": predictions}
+    rows = [{"sid": session_id, "ts": float(e["ts"]), "preds": e.get("predictions", [])} for e in events]
     async with SessionMaker() as s:
-        await s.execute(q, params)
+        await s.execute(q, rows)
         await s.commit()
+    return len(rows)
+
+async def get_latest_predictions(session_id: uuid.UUID, limit: int = 50) -> List[dict]:
+    """Последние limit событий аналитики сессии (по возрастанию ts)."""
+    q = text("""
+        select ts, predictions from session_predictions
+        where session_id = :sid
+        order by ts desc
+        limit :lim
+    """)
+    async with SessionMaker() as s:
+        res = await s.execute(q, {"sid": session_id, "lim": int(limit)})
+        rows = res.all()
+    return [{"ts": r[0], "predictions": r[1]} for r in reversed(rows)]
 
 # ========== ТОЧКИ ==========
 
+SAMPLE_CHUNK = 1024  # отсчётов в одной строке session_samples
+
+
+def _pack(a: np.ndarray) -> bytes:
+    return np.ascontiguousarray(a, dtype="<f8").tobytes()
+
+
+def _unpack(b: bytes) -> np.ndarray:
+    return np.frombuffer(b, dtype="<f8")
+
+
+# codec строки session_samples: "f8" — сырые float64, "dq+zlib"/"dq+lzma" — архив (см. compact_session_samples)
+CODEC_RAW = "f8"
+ARCHIVE_BLOCK = 65536  # отсчётов в одной архивной строке
+
+
+def _decode_row(codec: str, t: bytes, v: bytes) -> np.ndarray:
+    if codec == CODEC_RAW:
+        return np.column_stack((_unpack(t), _unpack(v)))
+    return decode_points(t, v, codec.split("+", 1)[1])
+
+
+def _plan_chunks(first_idx: int, points: np.ndarray, existing: List[tuple]) -> Tuple[List[tuple], np.ndarray]:
+    """
+    Как лечь батчу [first_idx, first_idx + N) в строки session_samples.
+    existing — уже записанные строки (first_idx, n, codec, t, v) начиная с блока first_idx.
+    Строки не пересекают границ first_idx // SAMPLE_CHUNK: открытая строка блока
+    дописывается, пока не наберёт SAMPLE_CHUNK отсчётов, поэтому размер строки не
+    зависит от размера батча писателя. Уже записанный префикс батча (ретрай после
+    потерянного ответа БД) пропускается.
+    Возвращает ([(first_idx строки, все её отсчёты (n, 2))], новые отсчёты).
+    """
+    end = first_idx + len(points)
+    start = first_idx
+    for f, n, *_ in existing:
+        if f <= start < f + n:
+            start = f + n
+    start = min(start, end)
+    fresh = points[start - first_idx:]
+    out = []
+    pos = start
+    while pos < end:
+        block_end = min(end, (pos // SAMPLE_CHUNK + 1) * SAMPLE_CHUNK)
+        part = points[pos - first_idx:block_end - first_idx]
+        open_row = next((r for r in existing if r[0] + r[1] == pos and r[0] // SAMPLE_CHUNK == pos // SAMPLE_CHUNK
+                         and r[2] == CODEC_RAW), None)
+        if open_row is not None:
+            f, _, _, t, v = open_row
+            out.append((f, np.concatenate((np.column_stack((_unpack(t), _unpack(v))), part))))
+        else:
+            out.append((pos, part))
+        pos = block_end
+    return out, fresh
 
 
-async def set_session_pipeline(
+async def append_session_samples(
     session_id: uuid.UUID,
-    bpm: Sequence[tuple[float, float]],
-    uterus: Sequence[tuple[float, float]],
-    window_seconds: float,
-) -> None:
-    pipeline = {
-        "bpm": list(bpm),
-        "uterus": list(uterus),
-        "window_seconds": float(window_seconds),
-    }
+    batches: dict,
+) -> int:
+    """
+    Дописывает новые отсчёты в session_samples (append-only).
+    batches: {channel: (first_idx, points (N, 2))}, first_idx — абсолютный номер
+    первого отсчёта в канале. Строки выровнены по блокам SAMPLE_CHUNK (см. _plan_chunks):
+    незаполненная строка блока дописывается следующими батчами.
+    Повтор батча с того же курсора (insert прошёл, но ответ потерян) безопасен:
+    в той же транзакции читаются уже записанные строки, и записывается только
+    то, чего в них нет.
+    В той же транзакции сводки session_rollups пополняются только новыми отсчётами.
+    Возвращает число действительно записанных новых отсчётов.
+    """
+    have_q = text("""
+        select first_idx, n, codec, t, v from session_samples
+        where session_id = :sid and channel = :ch and first_idx >= :lo and first_idx < :hi
+        order by first_idx
+    """)
+    q = text("""
+        insert into session_samples (session_id, channel, first_idx, chunk_start, chunk_end, n, t, v)
+        values (:sid, :ch, :idx, :t0, :t1, :n, :t, :v)
+        on conflict (session_id, channel, first_idx) do update set
+            chunk_end = excluded.chunk_end, n = excluded.n, t = excluded.t, v = excluded.v
+        where excluded.n > session_samples.n
+    """)
+    written = 0
+    async with SessionMaker() as s:
+        rows, fresh = [], {}
+        for channel, (first_idx, points) in batches.items():
+            if not len(points):
+                continue
+            existing = (await s.execute(have_q, {
+                "sid": session_id, "ch": channel,
+                "lo": int(first_idx) // SAMPLE_CHUNK * SAMPLE_CHUNK, "hi": int(first_idx + len(points)),
+            })).all()
+            chunks, new = _plan_chunks(int(first_idx), points, existing)
+            rows.extend({
+                "sid": session_id,
+                "ch": channel,
+                "idx": int(idx),
+                "t0": float(chunk[0, 0]),
+                "t1": float(chunk[-1, 0]),
+                "n": len(chunk),
+                "t": _pack(chunk[:, 0]),
+                "v": _pack(chunk[:, 1]),
+            } for idx, chunk in chunks)
+            if len(new):
+                fresh[channel] = new
+                written += len(new)
+        if rows:
+            await s.execute(q, rows)
+        rollups = _rollup_rows(session_id, fresh)
+        if rollups:
+            await s.execute(_ROLLUP_UPSERT, rollups)
+        await s.commit()
+    return written
 
-    q = (
-        text("""
-            update sessions
-            set pipeline = :pl
-            where id = :sid
-        """)
-        # Явно указываем типы, чтобы asyncpg корректно сериализовал
-        .bindparams(
-            bindparam("pl", type_=JSONB),
-            bindparam("sid", type_=PGUUID(as_uuid=True)),
-        )
+
+async def iter_session_samples(session_id: uuid.UUID, channels: Sequence[str]):
+    """
+    Асинхронный генератор для выгрузки: сначала {channel: число отсчётов}, затем пары
+    (channel, отсчёты (n, 2)) чанк за чанком через серверный курсор — в памяти
+    одновременно только текущий чанк. Всё читается в одной транзакции REPEATABLE READ,
+    поэтому число в начале совпадает с выданными отсчётами, даже если писатель тем
+    временем дописывает чанки или заменяет короткий чанк длинным.
+    """
+    count_q = text("""
+        select channel, coalesce(sum(n), 0) from session_samples
+        where session_id = :sid group by channel
+    """)
+    q = text("select codec, t, v from session_samples where session_id = :sid and channel = :ch order by first_idx")
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="REPEATABLE READ")
+        counts = dict((await conn.execute(count_q, {"sid": session_id})).all())
+        yield {ch: int(counts.get(ch, 0)) for ch in channels}
+        for ch in channels:
+            result = await conn.stream(q, {"sid": session_id, "ch": ch})
+            async for codec, t, v in result:
+                yield ch, _decode_row(codec, t, v)
+
+
+async def iter_session_predictions(session_id: uuid.UUID, batch: int = 500):
+    """Асинхронный генератор: события аналитики по возрастанию ts, списками по batch."""
+    q = text("""
+        select ts, predictions from session_predictions
+        where session_id = :sid
+        order by ts
+    """)
+    async with engine.connect() as conn:
+        result = await conn.stream(q, {"sid": session_id})
+        async for rows in result.partitions(batch):
+            yield [{"ts": r[0], "predictions": r[1]} for r in rows]
+
+
+# Сводки складываются с уже записанными: бакет может прийти несколькими батчами.
+# Считаются только от отсчётов, которых в session_samples ещё не было
+# (см. append_session_samples), поэтому повтор батча их не удваивает.
+_ROLLUP_UPSERT = text("""
+    insert into session_rollups (session_id, channel, level, bucket, n, vmin, vmax, vsum)
+    values (:sid, :ch, :lvl, :b, :n, :vmin, :vmax, :vsum)
+    on conflict (session_id, channel, level, bucket) do update set
+        n    = session_rollups.n + excluded.n,
+        vmin = least(session_rollups.vmin, excluded.vmin),
+        vmax = greatest(session_rollups.vmax, excluded.vmax),
+        vsum = session_rollups.vsum + excluded.vsum
+""")
+
+
+def _rollup_rows(session_id: uuid.UUID, fresh: dict) -> List[dict]:
+    """fresh: {channel: points (N, 2)} — отсчёты, впервые записанные в этой транзакции."""
+    rows = []
+    for channel, points in fresh.items():
+        if not len(points):
+            continue
+        for level in ROLLUP_LEVELS:
+            st = bucket_stats(points, level)
+            rows.extend(
+                {"sid": session_id, "ch": channel, "lvl": level, "b": int(b), "n": int(n),
+                 "vmin": float(lo), "vmax": float(hi), "vsum": float(sm)}
+                for b, n, lo, hi, sm in zip(st["bucket"], st["n"], st["vmin"], st["vmax"], st["vsum"])
+            )
+    return rows
+
+
+def _range_where(t_from: float | None, t_to: float | None, lo_col: str, hi_col: str) -> Tuple[str, dict]:
+    where, params = "", {}
+    if t_from is not None:
+        where += f" and {hi_col} >= :t_from"
+        params["t_from"] = float(t_from)
+    if t_to is not None:
+        where += f" and {lo_col} <= :t_to"
+        params["t_to"] = float(t_to)
+    return where, params
+
+
+async def get_session_history(
+    session_id: uuid.UUID,
+    channel: str,
+    t_from: float | None = None,
+    t_to: float | None = None,
+    points: int = 1000,
+) -> dict:
+    """
+    Канал в диапазоне [t_from, t_to] не больше чем в ~points точках:
+    {"level": 0|1|10|60, "t": [...], "min": [...], "max": [...], "mean": [...], "n": [...]}.
+    level 0 — сырые отсчёты; иначе читаются готовые сводки, и стоимость запроса
+    не зависит от длины сессии. Если сводок за диапазон нет (сессия записана до их
+    появления), бакеты считаются на лету по сырым отсчётам.
+    """
+    params = {"sid": session_id, "ch": channel}
+    where, rp = _range_where(t_from, t_to, "chunk_start", "chunk_end")
+    q = text(f"""
+        select coalesce(sum(n), 0), min(chunk_start), max(chunk_end)
+        from session_samples where session_id = :sid and channel = :ch{where}
+    """)
+    # чанки на краях захватывают отсчёты вне диапазона — точное число берём из секундных сводок
+    where1, rp1 = _range_where(
+        None if t_from is None else np.floor(t_from),
+        None if t_to is None else np.floor(t_to),
+        "bucket", "bucket",
     )
+    q1 = text(f"""
+        select coalesce(sum(n), 0) from session_rollups
+        where session_id = :sid and channel = :ch and level = 1{where1}
+    """)
+    async with SessionMaker() as s:
+        chunk_count, lo, hi = (await s.execute(q, {**params, **rp})).one()
+        raw_count = (await s.execute(q1, {**params, **rp1})).scalar() if chunk_count else 0
+    if not chunk_count:
+        return {"level": 0, **to_series(bucket_stats(np.empty((0, 2)), 1), 1)}
+    lo = lo if t_from is None else max(lo, t_from)
+    hi = hi if t_to is None else min(hi, t_to)
+    level = choose_level(hi - lo, points, int(raw_count or chunk_count))
+
+    if level == 0:
+        pts = await get_session_samples(session_id, channel, t_from, t_to)
+        n = np.ones(len(pts), dtype=np.int64)
+        return {"level": 0, "t": pts[:, 0].tolist(), "min": pts[:, 1].tolist(),
+                "max": pts[:, 1].tolist(), "mean": pts[:, 1].tolist(), "n": n.tolist()}
 
+    where, rp = _range_where(
+        None if t_from is None else np.floor(t_from / level),
+        None if t_to is None else np.floor(t_to / level),
+        "bucket", "bucket",
+    )
+    q = text(f"""
+        select bucket, n, vmin, vmax, vsum from session_rollups
+        where session_id = :sid and channel = :ch and level = :lvl{where}
+        order by bucket
+    """)
     async with SessionMaker() as s:
-        await s.execute(q, {"pl": pipeline, "sid": session_id})
-        await s.commit()
+        rows = (await s.execute(q, {**params, **rp, "lvl": level})).all()
+    if rows:
+        cols = list(zip(*rows))
+        st = {
+            "bucket": np.asarray(cols[0], dtype=np.int64),
+            "n": np.asarray(cols[1], dtype=np.int64),
+            "vmin": np.asarray(cols[2], dtype=np.float64),
+            "vmax": np.asarray(cols[3], dtype=np.float64),
+            "vsum": np.asarray(cols[4], dtype=np.float64),
+        }
+    else:
+        st = bucket_stats(await get_session_samples(session_id, channel, t_from, t_to), level)
+    # самый крупный уровень не уложился в points — доукрупняем на лету
+    factor = max(1, -(-len(st["bucket"]) // points))
+    return {"level": level * factor, **to_series(merge_buckets(st, factor), level * factor)}
+
+
+async def get_session_samples(
+    session_id: uuid.UUID,
+    channel: str,
+    t_from: float | None = None,
+    t_to: float | None = None,
+) -> np.ndarray:
+    """Отсчёты канала в диапазоне [t_from, t_to] как массив (N, 2); читаются только нужные чанки."""
+    where = "session_id = :sid and channel = :ch"
+    params = {"sid": session_id, "ch": channel}
+    if t_from is not None:
+        where += " and chunk_end >= :t_from"
+        params["t_from"] = float(t_from)
+    if t_to is not None:
+        where += " and chunk_start <= :t_to"
+        params["t_to"] = float(t_to)
+    q = text(f"select codec, t, v from session_samples where {where} order by first_idx")
+    async with SessionMaker() as s:
+        res = await s.execute(q, params)
+        rows = res.all()
+    if not rows:
+        return np.empty((0, 2), dtype=np.float64)
+    pts = np.concatenate([_decode_row(*r) for r in rows])
+    t, v = pts[:, 0], pts[:, 1]
+    mask = np.ones(len(t), dtype=bool)
+    if t_from is not None:
+        mask &= t >= t_from
+    if t_to is not None:
+        mask &= t <= t_to
+    return np.column_stack((t[mask], v[mask]))
+
+
+async def compact_session_samples(session_id: uuid.UUID, compressor: str = "zlib") -> dict:
+    """
+    Архивирует отсчёты остановленной сессии: сырые чанки канала заменяются блоками
+    по ARCHIVE_BLOCK отсчётов, закодированными utils/archive_codec (квантование,
+    дельты от номинального шага, zlib/lzma). Блок проверяется декодированием до записи;
+    замена идёт в одной транзакции на канал. Возвращает размеры до/после.
+    """
+    stats = {"samples": 0, "raw_bytes": 0, "archived_bytes": 0}
+    codec = f"dq+{compressor}"
+    for channel in ("bpm", "uterus"):
+        params = {"sid": session_id, "ch": channel, "raw": CODEC_RAW}
+        async with SessionMaker() as s:
+            res = await s.execute(text("""
+                select first_idx, t, v from session_samples
+                where session_id = :sid and channel = :ch and codec = :raw
+                order by first_idx
+            """), params)
+            rows = res.all()
+            if not rows:
+                continue
+            blocks, cur, cur_n = [], [], 0
+            for first_idx, t, v in rows:
+                cur.append((first_idx, _unpack(t), _unpack(v)))
+                cur_n += len(cur[-1][1])
+                if cur_n >= ARCHIVE_BLOCK:
+                    blocks.append(cur)
+                    cur, cur_n = [], 0
+            if cur:
+                blocks.append(cur)
+
+            new_rows = []
+            for block in blocks:
+                pts = np.column_stack((np.concatenate([b[1] for b in block]), np.concatenate([b[2] for b in block])))
+                et, ev = encode_points(pts, channel, compressor)
+                back = decode_points(et, ev, compressor)
+                if not (np.array_equal(back[:, 0], quantize(pts[:, 0], TIME_RESOLUTION))
+                        and np.array_equal(back[:, 1], quantize(pts[:, 1], VALUE_RESOLUTION[channel]))):
+                    raise ValueError(f"archive round-trip mismatch ({session_id}, {channel})")
+                new_rows.append({
+                    "sid": session_id, "ch": channel, "idx": int(block[0][0]),
+                    "t0": float(back[0, 0]), "t1": float(back[-1, 0]), "n": len(back),
+                    "t": et, "v": ev, "codec": codec,
+                })
+                stats["samples"] += len(pts)
+                stats["raw_bytes"] += 2 * pts[:, 0].nbytes
+                stats["archived_bytes"] += len(et) + len(ev)
+
+            await s.execute(text("""
+                delete from session_samples
+                where session_id = :sid and channel = :ch and codec = :raw
+            """), params)
+            await s.execute(text("""
+                insert into session_samples (session_id, channel, first_idx, chunk_start, chunk_end, n, t, v, codec)
+                values (:sid, :ch, :idx, :t0, :t1, :n, :t, :v, :codec)
+            """), new_rows)
+            await s.commit()
+    return stats
 
 
 async def get_session_pipeline(session_id: uuid.UUID) -> dict:
+    """
+    Пайплайн сессии в прежнем формате {bpm: [[t, v], ...], uterus: [...], window_seconds}.
+    Отсчёты собираются из session_samples; для старых сессий — из sessions.pipeline.
+    """
     q = text("select pipeline from sessions where id = :sid")
     async with SessionMaker() as s:
         res = await s.execute(q, {"sid": session_id})
         row = res.first()
-        return row[0] if row else {"bpm": [], "uterus": [], "window_seconds": 0.0}
+    pipeline = row[0] if row else {"bpm": [], "uterus": [], "window_seconds": 0.0}
+    bpm = await get_session_samples(session_id, "bpm")
+    uterus = await get_session_samples(session_id, "uterus")
+    if len(bpm) or len(uterus):
+        pipeline = {**pipeline, "bpm": bpm.tolist(), "uterus": uterus.tolist()}
+    return pipeline
 
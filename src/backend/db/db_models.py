@@ -1,6 +1,6 @@
 # SQLAlchemy модели (async)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String, Text, JSON, CheckConstraint, text
+from sqlalchemy import String, Text, JSON, CheckConstraint, text, ForeignKey, Integer, BigInteger, LargeBinary
 from sqlalchemy.dialects.postgresql import UUID, DOUBLE_PRECISION, JSONB
 import uuid
 from datetime import datetime
@@ -30,3 +30,38 @@ class Session(Base):
         CheckConstraint("status in ('starting','running','stopped','error')", name="sessions_status_chk"),
     )
 
+class SessionSample(Base):
+    """Чанк отсчётов одного канала (append-only, см. init/04_samples.sql)."""
+    __tablename__ = "session_samples"
+    session_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True)
+    channel: Mapped[str] = mapped_column(String(16), primary_key=True)
+    first_idx: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    chunk_start: Mapped[float] = mapped_column(DOUBLE_PRECISION, nullable=False)
+    chunk_end: Mapped[float] = mapped_column(DOUBLE_PRECISION, nullable=False)
+    n: Mapped[int] = mapped_column(Integer, nullable=False)
+    t: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    v: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    codec: Mapped[str] = mapped_column(String(16), nullable=False, server_default=text("'f8'"))  # см. init/07_archive.sql
+    __table_args__ = (
+        CheckConstraint("channel in ('bpm','uterus')", name="session_samples_channel_chk"),
+    )
+
+class SessionPrediction(Base):
+    """Событие аналитики сессии (см. init/05_predictions.sql)."""
+    __tablename__ = "session_predictions"
+    session_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True)
+    ts: Mapped[float] = mapped_column(DOUBLE_PRECISION, primary_key=True)
+    predictions: Mapped[list] = mapped_column(JSONB, nullable=False, server_default=text("'[]'::jsonb"))
+    created_at: Mapped[datetime] = mapped_column(server_default=text("now()"))
+
+class SessionRollup(Base):
+    """Сводка min/max/sum/count канала за бакет level секунд (см. init/06_rollups.sql)."""
+    __tablename__ = "session_rollups"
+    session_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True)
+    channel: Mapped[str] = mapped_column(String(16), primary_key=True)
+    level: Mapped[int] = mapped_column(Integer, primary_key=True)
+    bucket: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    n: Mapped[int] = mapped_column(Integer, nullable=False)
+    vmin: Mapped[float] = mapped_column(DOUBLE_PRECISION, nullable=False)
+    vmax: Mapped[float] = mapped_column(DOUBLE_PRECISION, nullable=False)
+    vsum: Mapped[float] = mapped_column(DOUBLE_PRECISION, nullable=False)
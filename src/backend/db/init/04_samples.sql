@@ -0,0 +1,16 @@
+-- Отсчёты сигналов: append-only чанки вместо перезаписи sessions.pipeline
+create table if not exists session_samples (
+  session_id   uuid             not null references sessions(id) on delete cascade,
+  channel      varchar(16)      not null check (channel in ('bpm','uterus')),
+  first_idx    bigint           not null,  -- абсолютный номер первого отсчёта чанка в канале
+  chunk_start  double precision not null,  -- время первого отсчёта, сек от старта сессии
+  chunk_end    double precision not null,  -- время последнего отсчёта
+  n            integer          not null,
+  t            bytea            not null,  -- float64 little-endian [n]
+  v            bytea            not null,  -- float64 little-endian [n]
+  primary key (session_id, channel, first_idx)
+);
+
+-- Выборка по диапазону времени
+create index if not exists idx_session_samples_range
+  on session_samples (session_id, channel, chunk_start);
@@ -0,0 +1,8 @@
+-- События аналитики: одна строка на событие вместо дописывания всего списка в sessions.meta
+create table if not exists session_predictions (
+  session_id   uuid             not null references sessions(id) on delete cascade,
+  ts           double precision not null,  -- unix сек, момент события (ключ идемпотентности)
+  predictions  jsonb            not null default '[]'::jsonb,
+  created_at   timestamptz      not null default now(),
+  primary key (session_id, ts)
+);
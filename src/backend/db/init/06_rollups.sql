@@ -0,0 +1,14 @@
+-- Многоуровневые сводки отсчётов для запросов истории по диапазону:
+-- бакет уровня level (сек) — отсчёты канала с floor(t / level) = bucket.
+-- Строятся при записи session_samples; mean = vsum / n.
+create table if not exists session_rollups (
+  session_id  uuid             not null references sessions(id) on delete cascade,
+  channel     varchar(16)      not null check (channel in ('bpm','uterus')),
+  level       integer          not null check (level in (1, 10, 60)),
+  bucket      bigint           not null,
+  n           integer          not null,
+  vmin        double precision not null,
+  vmax        double precision not null,
+  vsum        double precision not null,
+  primary key (session_id, channel, level, bucket)
+);
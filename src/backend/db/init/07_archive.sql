@@ -0,0 +1,5 @@
+-- Архив остановленных сессий: строки session_samples с codec <> 'f8' хранят
+-- закодированные блоки (utils/archive_codec.py: квантование + дельты + zlib/lzma)
+alter table session_samples
+  add column if not exists codec varchar(16) not null default 'f8'
+  check (codec in ('f8', 'dq+zlib', 'dq+lzma'));
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# модули бэкенда импортируются как в app.py: utils.*, db.* от src/backend
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import app as A
+from utils.ingest_codec import parse_body
+from utils.ws_codec import encode_binary
+
+
+@pytest.mark.parametrize("body", [
+    b'{"bpm": [[NaN, 120]]}',
+    b'{"bpm": [[1, 120], [Infinity, 121]]}',
+    b'{"uterus": [[1, -Infinity]]}',
+    b'{"source": "bpm", "time": NaN, "value": 120}',
+])
+def test_codec_rejects_non_finite_json(body):
+    with pytest.raises(ValueError):
+        parse_body(body)
+
+
+def test_codec_rejects_non_finite_binary():
+    frame = encode_binary({"seq": 1, "bpm": np.array([[1.0, 120.0], [np.inf, 121.0]])})
+    with pytest.raises(ValueError):
+        parse_body(frame)
+
+
+def test_codec_rejects_truncated_binary():
+    for body in (b"CTG1", b"CTG1\x00", b"CTG1\xff\x00\x00\x00{}"):
+        with pytest.raises(ValueError):
+            parse_body(body)
+
+
+def test_apply_ingest_skips_non_finite_and_keeps_channel_usable():
+    ctx = A.RuntimeCtx()
+    bad = A.IngestBatch(None, {"bpm": (np.array([np.nan, np.inf]), np.array([120.0, 121.0]))})
+    res = A.apply_ingest(ctx, [bad])
+    assert res["samples"] == 0 and res["rejected"] == 2
+    good = parse_body(b'{"bpm": [[1, 120], [2, 121]]}')
+    res = A.apply_ingest(ctx, good)
+    assert res["samples"] == 2 and res["rejected"] == 2
+    assert ctx.buffers.latest_time() == 2.0
+
+
+def _batch(seq, t0):
+    return A.IngestBatch(seq, {"bpm": (np.array([t0, t0 + 0.25]), np.array([140.0, 141.0]))})
+
+
+def test_apply_ingest_reports_late_gap_batch():
+    ctx = A.RuntimeCtx()
+    A.apply_ingest(ctx, [_batch(3, 1.0)])
+    res = A.apply_ingest(ctx, [_batch(5, 2.0)])
+    assert res["gaps"] == 1 and res["last_seq"] == 5
+    # ретрай seq 4 после принятого 5: не повтор, а опоздавший пакет
+    res = A.apply_ingest(ctx, [_batch(4, 1.5)])
+    assert res["late_seqs"] == [4] and res["duplicates"] == 0 and res["rejected"] == 2
+    # второй раз он уже повтор
+    res = A.apply_ingest(ctx, [_batch(4, 1.5)])
+    assert res["late_seqs"] == [] and res["duplicates"] == 1
+    res = A.apply_ingest(ctx, [_batch(5, 2.0)])
+    assert res["duplicates"] == 2 and res["accepted"] == 0
@@ -0,0 +1,88 @@
+import lzma
+import struct
+import zlib
+from typing import Tuple
+
+import numpy as np
+
+# Компактное представление столбца (времён или значений) для архива остановленных сессий:
+#   1) квантование к разрешению res: q = round(x / res) (int64);
+#   2) разности соседних q минус номинальный шаг (для времени — типичный интервал
+#      отсчётов, для значений — 0), остатки в самом узком целом типе;
+#   3) сжатие zlib или lzma.
+# Декодирование даёт ровно q * res, т.е. бит-в-бит то же, что quantize(x, res).
+#
+# Формат: MAGIC | float64 res | int64 q0 | int64 step | uint32 n | uint8 ширина остатка | сжатые остатки
+
+MAGIC = b"CQ1\0"
+_HEADER = struct.Struct("<4sdqqIB")
+
+TIME_RESOLUTION = 1e-4  # сек
+# разрешение датчиков: ЧСС — 0.01 уд/мин, токограмма — 0.01 ед.
+VALUE_RESOLUTION = {"bpm": 0.01, "uterus": 0.01}
+
+COMPRESSORS = {
+    "zlib": (lambda b: zlib.compress(b, 9), zlib.decompress),
+    "lzma": (lambda b: lzma.compress(b, preset=9), lzma.decompress),
+}
+
+_INT_TYPES = (np.int8, np.int16, np.int32, np.int64)
+
+
+def quantize(x: np.ndarray, res: float) -> np.ndarray:
+    """Значения, которые вернёт decode_column после encode_column."""
+    return np.round(np.asarray(x, dtype=np.float64) / res).astype(np.int64) * res
+
+
+def _narrowest(r: np.ndarray):
+    if len(r) == 0:
+        return np.int8
+    lo, hi = int(r.min()), int(r.max())
+    for dt in _INT_TYPES:
+        info = np.iinfo(dt)
+        if info.min <= lo and hi <= info.max:
+            return dt
+    return np.int64
+
+
+def encode_column(x: np.ndarray, res: float, *, nominal_step: bool, compressor: str = "zlib") -> bytes:
+    """
+    Кодирует столбец. nominal_step=True — разности берутся относительно медианного
+    шага (времена с почти постоянным интервалом дают остатки около нуля).
+    """
+    q = np.round(np.asarray(x, dtype=np.float64) / res).astype(np.int64)
+    n = len(q)
+    q0 = int(q[0]) if n else 0
+    d = np.diff(q)
+    step = int(np.median(d)) if nominal_step and len(d) else 0
+    r = d - step
+    dt = _narrowest(r)
+    payload = COMPRESSORS[compressor][0](r.astype(dt).tobytes())
+    return _HEADER.pack(MAGIC, res, q0, step, n, np.dtype(dt).itemsize) + payload
+
+
+def decode_column(buf: bytes, compressor: str = "zlib") -> np.ndarray:
+    magic, res, q0, step, n, width = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError("bad archive column magic")
+    if n == 0:
+        return np.empty(0, dtype=np.float64)
+    raw = COMPRESSORS[compressor][1](buf[_HEADER.size:])
+    r = np.frombuffer(raw, dtype=f"<i{width}").astype(np.int64)
+    q = np.empty(n, dtype=np.int64)
+    q[0] = q0
+    np.cumsum(r + step, out=q[1:])
+    q[1:] += q0
+    return q * res
+
+
+def encode_points(points: np.ndarray, channel: str, compressor: str = "zlib") -> Tuple[bytes, bytes]:
+    """Отсчёты (N, 2) → (закодированные времена, закодированные значения)."""
+    return (
+        encode_column(points[:, 0], TIME_RESOLUTION, nominal_step=True, compressor=compressor),
+        encode_column(points[:, 1], VALUE_RESOLUTION[channel], nominal_step=False, compressor=compressor),
+    )
+
+
+def decode_points(t: bytes, v: bytes, compressor: str = "zlib") -> np.ndarray:
+    return np.column_stack((decode_column(t, compressor), decode_column(v, compressor)))
@@ -1,169 +1,182 @@
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Sequence, Union
+
+import numpy as np
 
 Pair = Tuple[float, float]  # (t, v)
+Signal = Union[Sequence[Pair], np.ndarray]  # список пар или массив (N, 2)
+
+# сколько элементов держим в одной матрице окон (строки * ширина окна)
+_BLOCK_ELEMS = 1 << 20
+
+
+def _as_array(data: Signal) -> np.ndarray:
+    """Приводит список пар (t, v) или массив к float64-массиву формы (N, 2)."""
+    arr = np.asarray(data, dtype=np.float64)
+    if arr.size == 0:
+        return np.empty((0, 2), dtype=np.float64)
+    return arr.reshape(-1, 2)
+
+
+def _window_bounds(t: np.ndarray, window_sec: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Границы окна [t_i - window_sec, t_i + window_sec] для каждой точки (включительно).
+    Время предполагается неубывающим — как и в исходной реализации на списках.
+    """
+    idx = np.arange(len(t))
+    j0 = np.minimum(np.searchsorted(t, t - window_sec, side="left"), idx)
+    j1 = np.maximum(np.searchsorted(t, t + window_sec, side="right") - 1, idx)
+    return j0, j1
+
+
+def _sorted_windows(x: np.ndarray, j0: np.ndarray, cnt: np.ndarray, width: int) -> np.ndarray:
+    """Матрица окон (строки отсортированы, хвост добит NaN — он уходит в конец)."""
+    cols = j0[:, None] + np.arange(width)[None, :]
+    valid = np.arange(width)[None, :] < cnt[:, None]
+    win = np.where(valid, x[np.minimum(cols, len(x) - 1)], np.nan)
+    win.sort(axis=1)
+    return win
+
+
+def _median_rows(win: np.ndarray, cnt: np.ndarray) -> np.ndarray:
+    """Медиана строк отсортированной матрицы окон; совпадает с _median на списках."""
+    rows = np.arange(len(cnt))
+    lo = win[rows, (cnt - 1) // 2]
+    hi = win[rows, cnt // 2]
+    return 0.5 * (lo + hi)
+
+
+def rolling_median_mad(
+    t: np.ndarray,
+    v: np.ndarray,
+    window_sec: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Скользящие медиана и MAD по *временному* окну ±window_sec.
+    Считается блоками, чтобы матрица окон не разрасталась на многочасовых записях.
+    """
+    n = len(v)
+    med = np.empty(n, dtype=np.float64)
+    mad = np.empty(n, dtype=np.float64)
+    if n == 0:
+        return med, mad
+    j0, j1 = _window_bounds(t, window_sec)
+    cnt = j1 - j0 + 1
+    width = int(cnt.max())
+    step = max(1, _BLOCK_ELEMS // width)
+    for s in range(0, n, step):
+        e = min(n, s + step)
+        b_j0, b_cnt = j0[s:e], cnt[s:e]
+        win = _sorted_windows(v, b_j0, b_cnt, width)
+        m = _median_rows(win, b_cnt)
+        dev = np.abs(win - m[:, None])
+        dev.sort(axis=1)
+        med[s:e] = m
+        mad[s:e] = _median_rows(dev, b_cnt)
+    return med, mad
 
-def _median(xs: List[float]) -> float:
-    n = len(xs)
-    if n == 0: return 0.0
-    s = sorted(xs)
-    m = n // 2
-    return s[m] if n % 2 else 0.5 * (s[m-1] + s[m])
 
 def despike_hampel_time(
-    data: List[Pair],
+    data: Signal,
     window_sec: float = 0.5,     # ширина окна (сек)
     n_sigma: float = 3.0,        # порог в "сигмах" (через MAD)
     replace_with: str = "median" # "median" или "interp"
-) -> List[Pair]:
+) -> np.ndarray:
     """
     Убирает кратковременные всплески по Хампелу в скользящем *временном* окне.
     window_sec=0.5 снимает «иглы» длительностью <~0.5–1 с.
+    Возвращает массив (N, 2).
     """
-    if not data:
-        return []
-    t_arr = [t for t, _ in data]
-    v_arr = [v for _, v in data]
-    out: List[Pair] = []
-
-    j0 = 0
-    for i, (t, v) in enumerate(data):
-        # окно [t - window_sec, t + window_sec]
-        while j0 < i and data[j0][0] < t - window_sec:
-            j0 += 1
-        j1 = i
-        while j1 + 1 < len(data) and data[j1 + 1][0] <= t + window_sec:
-            j1 += 1
-
-        win_vals = [v_arr[k] for k in range(j0, j1 + 1)]
-        med = _median(win_vals)
-        abs_dev = [abs(x - med) for x in win_vals]
-        mad = _median(abs_dev) or 1e-9  # защита от нуля
-
-        # 1.4826 ~ перевод MAD в σ при нормальном распределении
-        sigma = 1.4826 * mad
-        is_spike = abs(v - med) > n_sigma * sigma
-
-        if is_spike:
-            if replace_with == "median":
-                new_v = med
-            else:  # "interp": линейная интерполяция между соседями по времени
-                # ищем ближайших слева/справа
-                # (если нет одного из соседей — откатываемся на медиану)
-                left_idx = i - 1 if i - 1 >= 0 else None
-                right_idx = i + 1 if i + 1 < len(data) else None
-                if left_idx is not None and right_idx is not None:
-                    t0, v0 = data[left_idx]
-                    t1, v1 = data[right_idx]
-                    if t1 != t0:
-                        alpha = (t - t0) / (t1 - t0)
-                        new_v = v0 + alpha * (v1 - v0)
-                    else:
-                        new_v = med
-                else:
-                    new_v = med
-            out.append((t, new_v))
-        else:
-            out.append((t, v))
-    return out
+    arr = _as_array(data)
+    if len(arr) == 0:
+        return arr
+    t, v = arr[:, 0], arr[:, 1]
+    med, mad = rolling_median_mad(t, v, window_sec)
+    mad[mad == 0] = 1e-9  # защита от нуля
 
+    # 1.4826 ~ перевод MAD в σ при нормальном распределении
+    sigma = 1.4826 * mad
+    is_spike = np.abs(v - med) > n_sigma * sigma
+
+    new_v = v.copy()
+    if replace_with == "median":
+        new_v[is_spike] = med[is_spike]
+    else:  # "interp": линейная интерполяция между соседями по времени
+        # на краях и при совпадающих временах соседей откатываемся на медиану
+        new_v[is_spike] = med[is_spike]
+        inner = is_spike.copy()
+        inner[0] = inner[-1] = False
+        i = np.flatnonzero(inner)
+        t0, v0 = t[i - 1], v[i - 1]
+        t1, v1 = t[i + 1], v[i + 1]
+        ok = t1 != t0
+        i, t0, v0, t1, v1 = i[ok], t0[ok], v0[ok], t1[ok], v1[ok]
+        alpha = (t[i] - t0) / (t1 - t0)
+        new_v[i] = v0 + alpha * (v1 - v0)
+    return np.column_stack((t, new_v))
 
-def moving_average_time(
-    data: List[Pair],
-    window_sec: float = 0.3
-) -> List[Pair]:
-    """
-    Скользящее среднее по *временному* окну ±window_sec.
-    """
-    if not data:
-        return []
-    out: List[Pair] = []
-    j0 = 0
-    for i, (t, _) in enumerate(data):
-        # окно [t - window_sec, t + window_sec]
-        while j0 < i and data[j0][0] < t - window_sec:
-            j0 += 1
-        j1 = i
-        while j1 + 1 < len(data) and data[j1 + 1][0] <= t + window_sec:
-            j1 += 1
-        s = 0.0
-        cnt = 0
-        for k in range(j0, j1 + 1):
-            s += data[k][1]; cnt += 1
-        out.append((t, s / max(1, cnt)))
-    return out
 
 def moving_average_time(
-    data: List[Pair],
+    data: Signal,
     window_sec: float = 0.3
-) -> List[Pair]:
+) -> np.ndarray:
     """
-    Скользящее среднее по *временному* окну ±window_sec.
+    Скользящее среднее по *временному* окну ±window_sec (через кумулятивные суммы).
+    Возвращает массив (N, 2).
     """
-    if not data:
-        return []
-    out: List[Pair] = []
-    j0 = 0
-    for i, (t, _) in enumerate(data):
-        # окно [t - window_sec, t + window_sec]
-        while j0 < i and data[j0][0] < t - window_sec:
-            j0 += 1
-        j1 = i
-        while j1 + 1 < len(data) and data[j1 + 1][0] <= t + window_sec:
-            j1 += 1
-        s = 0.0
-        cnt = 0
-        for k in range(j0, j1 + 1):
-            s += data[k][1]; cnt += 1
-        out.append((t, s / max(1, cnt)))
-    return out
+    arr = _as_array(data)
+    if len(arr) == 0:
+        return arr
+    t, v = arr[:, 0], arr[:, 1]
+    j0, j1 = _window_bounds(t, window_sec)
+    csum = np.concatenate(([0.0], np.cumsum(v)))
+    avg = (csum[j1 + 1] - csum[j0]) / (j1 - j0 + 1)
+    return np.column_stack((t, avg))
+
 
 def clamp_derivative(
-    data: List[Pair],
+    data: Signal,
     max_rate_per_sec: float = 100.0  # максимально допустимое изменение в ед/с
-) -> List[Pair]:
+) -> np.ndarray:
     """
     Ограничивает скорость изменения: |v[i]-v[i-1]|/dt <= max_rate_per_sec.
+    Участки без нарушений копируются векторно; по точкам проходим только
+    внутри «зажатых» отрезков, пока выход не догонит исходный сигнал.
+    Возвращает массив (N, 2).
     """
-    if not data:
-        return []
-    out: List[Pair] = [data[0]]
-    for i in range(1, len(data)):
-        t_prev, v_prev = out[-1]
-        t, v = data[i]
-        dt = max(1e-6, t - t_prev)
-        dv = v - v_prev
-        max_dv = max_rate_per_sec * dt
-        if abs(dv) > max_dv:
-            v = v_prev + (max_dv if dv > 0 else -max_dv)
-        out.append((t, v))
-    return out
+    arr = _as_array(data)
+    if len(arr) == 0:
+        return arr
+    t, v = arr[:, 0], arr[:, 1]
+    out = v.copy()
+    max_dv = max_rate_per_sec * np.maximum(1e-6, np.diff(t))
+    # нарушения по сырому сигналу: до первого из них выход совпадает со входом
+    viol = np.flatnonzero(np.abs(np.diff(v)) > max_dv) + 1
 
-
-def clean_signal(
-    data: List[Pair],
-    *,
-    hampel_win=0.5,
-    hampel_sigma=3.0,
-    ma_win=0.3,
-    max_rate=None  # например, 80.0
-) -> List[Pair]:
-    x = despike_hampel_time(data, window_sec=hampel_win, n_sigma=hampel_sigma, replace_with="median")
-    x = moving_average_time(x, window_sec=ma_win)
-    if max_rate is not None:
-        x = clamp_derivative(x, max_rate_per_sec=max_rate)
-    return x
+    n = len(v)
+    k = 0
+    while k < len(viol):
+        i = int(viol[k])
+        while i < n:
+            dv = v[i] - out[i - 1]
+            lim = max_dv[i - 1]
+            if abs(dv) <= lim:
+                break  # догнали сигнал — дальше снова совпадаем со входом
+            out[i] = out[i - 1] + (lim if dv > 0 else -lim)
+            i += 1
+        k = int(np.searchsorted(viol, i, side="right"))
+    return np.column_stack((t, out))
 
 
 def clean_signal(
-    data: List[Pair],
+    data: Signal,
     *,
     hampel_win=0.5,
     hampel_sigma=3.0,
     ma_win=0.3,
     max_rate=None  # например, 80.0
-) -> List[Pair]:
+) -> np.ndarray:
     x = despike_hampel_time(data, window_sec=hampel_win, n_sigma=hampel_sigma, replace_with="median")
     x = moving_average_time(x, window_sec=ma_win)
     if max_rate is not None:
         x = clamp_derivative(x, max_rate_per_sec=max_rate)
-    return x
\ No newline at end of file
+    return x
@@ -0,0 +1,91 @@
+import math
+from typing import Dict, Optional
+
+import numpy as np
+
+# допустимые разрешения клиента (точек на окно); округляем, чтобы кэш не дробился
+MIN_POINTS = 200
+MAX_POINTS = 10000
+POINTS_STEP = 100
+
+_EMPTY = np.empty((0, 2), dtype=np.float64)
+
+
+def quantize_points(points: int) -> int:
+    p = int(round(points / POINTS_STEP)) * POINTS_STEP
+    return max(MIN_POINTS, min(MAX_POINTS, p))
+
+
+def minmax_buckets(points: np.ndarray, bucket_sec: float) -> np.ndarray:
+    """
+    Прореживание min/max: в каждом бакете времени [k*bucket_sec, (k+1)*bucket_sec)
+    остаются точки с минимальным и максимальным значением (в порядке времени).
+    Пики и децелерации не сглаживаются, а сетка бакетов не зависит от начала
+    выборки — результат можно достраивать кусками.
+    """
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(pts) == 0:
+        return _EMPTY
+    b = np.floor(pts[:, 0] / bucket_sec).astype(np.int64)
+    order = np.lexsort((pts[:, 1], b))  # по бакету, внутри — по значению
+    bs = b[order]
+    starts = np.flatnonzero(np.r_[True, bs[1:] != bs[:-1]])
+    ends = np.r_[starts[1:], len(bs)] - 1
+    idx = np.unique(np.concatenate((order[starts], order[ends])))
+    return pts[idx]
+
+
+class BucketReducer:
+    """
+    Потоковое min/max-прореживание для одного разрешения экрана.
+
+    Клиенту уходят только закрытые бакеты (t < boundary); точки открытого
+    бакета копятся в pending и отправляются, когда время перейдёт границу.
+    Один экземпляр обслуживает всех клиентов с этим разрешением.
+    """
+
+    def __init__(self, points: int, window_seconds: float):
+        self.points = points
+        # две точки (min и max) на бакет
+        self.bucket_sec = window_seconds / max(1, points // 2)
+        self.boundary: Optional[float] = None
+        self.pending: Dict[str, np.ndarray] = {}
+
+    def _floor(self, t: float) -> float:
+        return math.floor(t / self.bucket_sec) * self.bucket_sec
+
+    def seed(self, channels: Dict[str, np.ndarray]) -> None:
+        """Начальное состояние по окну снепшота: граница — начало последнего бакета."""
+        last = [float(a[-1, 0]) for a in channels.values() if len(a)]
+        self.boundary = self._floor(max(last)) if last else 0.0
+        self.pending = {
+            name: np.asarray(a)[np.asarray(a)[:, 0] >= self.boundary] if len(a) else _EMPTY
+            for name, a in channels.items()
+        }
+
+    def closed(self, points: np.ndarray) -> np.ndarray:
+        """Прореженные закрытые бакеты (для снепшота)."""
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if self.boundary is not None:
+            pts = pts[pts[:, 0] < self.boundary]
+        return minmax_buckets(pts, self.bucket_sec)
+
+    def push(self, channels: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Добавляет новые точки; возвращает бакеты, закрывшиеся на этом шаге."""
+        for name, a in channels.items():
+            prev = self.pending.get(name, _EMPTY)
+            self.pending[name] = np.concatenate((prev, a)) if len(prev) else np.asarray(a)
+        last = [float(a[-1, 0]) for a in self.pending.values() if len(a)]
+        if not last:
+            return {}
+        new_boundary = self._floor(max(last))
+        if self.boundary is not None and new_boundary <= self.boundary:
+            return {}
+        self.boundary = new_boundary
+        out: Dict[str, np.ndarray] = {}
+        for name, a in self.pending.items():
+            cut = int(np.searchsorted(a[:, 0], new_boundary, side="left")) if len(a) else 0
+            if cut:
+                out[name] = minmax_buckets(a[:cut], self.bucket_sec)
+                self.pending[name] = a[cut:]
+        return out
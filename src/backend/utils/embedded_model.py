@@ -0,0 +1,64 @@
+import asyncio
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# Встроенный режим инференса: признаки + CatBoost из src/model_api вызываются
+# прямо на массивах в пуле процессов бэкенда, без CSV и HTTP.
+# Модули model_api импортируются по коротким именам (как в model_app.py),
+# поэтому их папка добавляется в sys.path каждого рабочего процесса.
+
+
+def _init_worker(model_api_dir: str) -> None:
+    if model_api_dir not in sys.path:
+        sys.path.insert(0, model_api_dir)
+    # у model_api свой модуль utils.py, а у бэкенда — пакет utils: на время импорта
+    # убираем пакет из sys.modules, затем возвращаем (он нужен для распаковки задач пула)
+    backend_utils = {k: sys.modules.pop(k) for k in list(sys.modules) if k == "utils" or k.startswith("utils.")}
+    try:
+        import inference  # noqa: F401  (тянет feature_extraction, model, evaluate, utils из model_api)
+        from model import get_models
+    finally:
+        sys.modules.pop("utils", None)
+        sys.modules.update(backend_utils)
+    get_models()  # чекпойнты читаются один раз на процесс, при старте
+
+
+def _predict(bpm: np.ndarray, uterus: np.ndarray, threshold: float) -> Dict[str, Any]:
+    from inference import predict_signals
+    return predict_signals(bpm, uterus, threshold=threshold)
+
+
+class EmbeddedModel:
+    """Пул процессов с загруженными моделями; predict() не блокирует цикл событий."""
+
+    def __init__(self, model_api_dir: str, workers: int = 2):
+        self.model_api_dir = os.path.abspath(model_api_dir)
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.model_api_dir,),
+            )
+
+    async def predict(self, bpm: np.ndarray, uterus: np.ndarray, threshold: float) -> Dict[str, Any]:
+        """
+        bpm, uterus — значения каналов (1D). Массивы передаются в другой процесс
+        не сразу, поэтому вызывающий должен отдать собственные копии, а не срезы буфера.
+        Ответ в формате model_api /predict: {"labels": [...], "predictions": {...}}.
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, _predict, bpm, uterus, threshold)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
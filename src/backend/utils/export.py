@@ -0,0 +1,153 @@
+import io
+import json
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Кодировщики выгрузки сессии: каждый превращает очередной кусок данных в байты,
+# поэтому ответ отдаётся потоком и память не зависит от длины сессии.
+
+EXPORT_FORMATS = ("csv", "parquet", "npy")
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "npy": "application/octet-stream",
+}
+
+# NPY: одномерный структурированный массив, канал — код из CHANNEL_CODES
+CHANNEL_CODES = {"bpm": 0, "uterus": 1}
+SAMPLE_DTYPE = np.dtype([("channel", "u1"), ("t", "<f8"), ("v", "<f8")])
+
+PARQUET_ROW_GROUP = 65536  # строк в одной row group (столько и держим в памяти)
+
+
+# ---- отсчёты ----
+
+def samples_csv_header() -> bytes:
+    return b"channel,t,value\n"
+
+
+def samples_csv(channel: str, points: np.ndarray) -> bytes:
+    return "".join(f"{channel},{t!r},{v!r}\n" for t, v in points.tolist()).encode("ascii")
+
+
+def samples_npy_header(n: int) -> bytes:
+    """Заголовок .npy на n строк: размер известен заранее, дальше идут только данные."""
+    buf = io.BytesIO()
+    np.lib.format.write_array_header_1_0(buf, {
+        "descr": np.lib.format.dtype_to_descr(SAMPLE_DTYPE),
+        "fortran_order": False,
+        "shape": (int(n),),
+    })
+    return buf.getvalue()
+
+
+def samples_npy(channel: str, points: np.ndarray) -> bytes:
+    a = np.empty(len(points), dtype=SAMPLE_DTYPE)
+    a["channel"] = CHANNEL_CODES[channel]
+    a["t"] = points[:, 0]
+    a["v"] = points[:, 1]
+    return a.tobytes()
+
+
+# ---- события аналитики ----
+
+def predictions_csv_header() -> bytes:
+    return b"ts,predictions\n"
+
+
+def predictions_csv(events: List[dict]) -> bytes:
+    out = io.StringIO()
+    for e in events:
+        preds = json.dumps(e["predictions"], ensure_ascii=False).replace('"', '""')
+        out.write(f'{e["ts"]!r},"{preds}"\n')
+    return out.getvalue().encode("utf-8")
+
+
+# ---- parquet (pyarrow — необязательная зависимость) ----
+
+class _Sink(io.RawIOBase):
+    """Файл для ParquetWriter, который отдаёт записанное порциями через take()."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._parts.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def take(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+class ParquetStream:
+    """
+    Потоковая запись parquet: строки копятся до PARQUET_ROW_GROUP и сбрасываются
+    отдельной row group; push()/close() возвращают готовые байты файла.
+    kind: "samples" (channel, t, value) или "predictions" (ts, predictions — JSON-строка).
+    """
+
+    def __init__(self, kind: str):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        if kind == "samples":
+            self._schema = pa.schema([("channel", pa.string()), ("t", pa.float64()), ("value", pa.float64())])
+        else:
+            self._schema = pa.schema([("ts", pa.float64()), ("predictions", pa.string())])
+        self._sink = _Sink()
+        self._writer = pq.ParquetWriter(self._sink, self._schema)
+        self._cols: Dict[str, list] = {name: [] for name in self._schema.names}
+        self._rows = 0
+
+    def _flush(self) -> None:
+        if self._rows:
+            self._writer.write_table(self._pa.table(self._cols, schema=self._schema))
+            self._cols = {name: [] for name in self._schema.names}
+            self._rows = 0
+
+    def push_samples(self, channel: str, points: np.ndarray) -> bytes:
+        self._cols["channel"].extend([channel] * len(points))
+        self._cols["t"].extend(points[:, 0].tolist())
+        self._cols["value"].extend(points[:, 1].tolist())
+        self._rows += len(points)
+        if self._rows >= PARQUET_ROW_GROUP:
+            self._flush()
+        return self._sink.take()
+
+    def push_predictions(self, events: List[dict]) -> bytes:
+        for e in events:
+            self._cols["ts"].append(float(e["ts"]))
+            self._cols["predictions"].append(json.dumps(e["predictions"], ensure_ascii=False))
+        self._rows += len(events)
+        if self._rows >= PARQUET_ROW_GROUP:
+            self._flush()
+        return self._sink.take()
+
+    def close(self) -> bytes:
+        self._flush()
+        self._writer.close()
+        return self._sink.take()
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def export_filename(session_id: str, data: str, fmt: str, channel: Optional[str] = None) -> str:
+    suffix = f"_{channel}" if channel else ""
+    return f"session_{session_id}_{data}{suffix}.{fmt}"
@@ -0,0 +1,120 @@
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+Pair = Tuple[float, float]  # (t_sec, bpm)
+Event = Tuple[str, float, float]  # (вид, t, величина)
+
+BASELINE_SHIFT = "baseline_shift"
+PROLONGED_DECELERATION = "prolonged_deceleration"
+
+
+class FhrEventDetector:
+    """
+    Потоковый детектор событий ЧСС плода, точки подаются по одной:
+    - baseline_shift — базовая линия (медиана сглаженной ЧСС за base_win_sec)
+      ушла от опорной больше чем на shift_bpm; опорной становится новая;
+    - prolonged_deceleration — ЧСС ниже базовой на decel_bpm и больше дольше
+      prolonged_sec (событие одно на эпизод, в момент достижения длительности).
+
+    Отсчёты вне [min_valid, max_valid] — потеря сигнала, пропускаются.
+    Во время децелерации окно базовой линии не пополняется, чтобы эпизод
+    не тянул её вниз. До warmup_sec данных событий нет.
+    """
+
+    def __init__(
+        self,
+        *,
+        tau_sec: float = 3.0,
+        base_win_sec: float = 600.0,
+        warmup_sec: float = 120.0,
+        shift_bpm: float = 15.0,
+        decel_bpm: float = 15.0,
+        prolonged_sec: float = 120.0,
+        min_valid: float = 50.0,
+        max_valid: float = 240.0,
+    ):
+        self.tau_sec = tau_sec
+        self.base_win_sec = base_win_sec
+        self.warmup_sec = warmup_sec
+        self.shift_bpm = shift_bpm
+        self.decel_bpm = decel_bpm
+        self.prolonged_sec = prolonged_sec
+        self.min_valid = min_valid
+        self.max_valid = max_valid
+
+        self.n = 0
+        self.events: List[Event] = []
+        self.baseline: Optional[float] = None
+        # EMA
+        self._y = 0.0
+        self._t_prev = 0.0
+        self._t_first = 0.0
+        # окно базовой линии: порядок поступления + отсортированные значения
+        self._win: Deque[Pair] = deque()
+        self._sorted: List[float] = []
+        self._ref: Optional[float] = None  # опорная базовая линия для baseline_shift
+        # децелерация
+        self._decel_start: Optional[float] = None
+        self._decel_base = 0.0
+        self._decel_reported = False
+
+    def _median(self) -> float:
+        buf = self._sorted
+        n = len(buf)
+        return buf[(n - 1) // 2] if n % 2 else 0.5 * (buf[n // 2 - 1] + buf[n // 2])
+
+    def _push_baseline(self, t: float, y: float) -> None:
+        self._win.append((t, y))
+        insort(self._sorted, y)
+        while len(self._win) > 1 and self._win[0][0] < t - self.base_win_sec:
+            _, old = self._win.popleft()
+            del self._sorted[bisect_left(self._sorted, old)]
+        self.baseline = self._median()
+
+    def update(self, t: float, x: float) -> List[Event]:
+        """Добавляет точку (t, bpm); возвращает события, случившиеся на ней."""
+        if not (self.min_valid <= x <= self.max_valid):
+            return []
+        if self.n == 0:
+            self._y = x
+            self._t_first = t
+        else:
+            dt = max(1e-6, t - self._t_prev)
+            alpha = 1.0 - pow(2.718281828, -dt / self.tau_sec)  # 1 - exp(-dt/tau)
+            self._y = self._y + alpha * (x - self._y)
+        self._t_prev = t
+        self.n += 1
+        y = self._y
+
+        out: List[Event] = []
+        warm = t - self._t_first >= self.warmup_sec and self.baseline is not None
+
+        if self._decel_start is not None:
+            if y >= self._decel_base - self.decel_bpm:
+                self._decel_start = None
+            elif not self._decel_reported and t - self._decel_start >= self.prolonged_sec:
+                self._decel_reported = True
+                out.append((PROLONGED_DECELERATION, t, self._decel_base - y))
+        elif warm and y < self.baseline - self.decel_bpm:
+            self._decel_start = t
+            self._decel_base = self.baseline
+            self._decel_reported = False
+
+        if self._decel_start is None:
+            self._push_baseline(t, y)
+            if warm:
+                if self._ref is None:
+                    self._ref = self.baseline
+                elif abs(self.baseline - self._ref) >= self.shift_bpm:
+                    out.append((BASELINE_SHIFT, t, self.baseline - self._ref))
+                    self._ref = self.baseline
+
+        self.events.extend(out)
+        return out
+
+    def extend(self, points) -> List[Event]:
+        out: List[Event] = []
+        for t, v in points:
+            out.extend(self.update(t, v))
+        return out
@@ -0,0 +1,210 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+# Общая на процесс очередь вызовов модели. Запрос — «пересчитать сессию key»;
+# чем меньше приоритет, тем раньше он уходит в работу.
+PRIORITY_MANUAL = 0   # /flush: ждёт пользователь
+PRIORITY_ALARM = 1    # событие на сигнале (схватка, сдвиг базальной линии, децелерация)
+PRIORITY_ROUTINE = 2  # плановое обновление по таймеру
+
+PRIORITY_NAMES = {PRIORITY_MANUAL: "manual", PRIORITY_ALARM: "alarm", PRIORITY_ROUTINE: "routine"}
+
+
+class _Pending:
+    __slots__ = ("priority", "seq", "not_before", "created", "reasons", "waiters")
+
+    def __init__(self, priority: int, seq: int, not_before: float, created: float):
+        self.priority = priority
+        self.seq = seq              # совпадает с seq актуальной записи в куче
+        self.not_before = not_before
+        self.created = created
+        self.reasons: List[str] = []
+        self.waiters: List[asyncio.Future] = []
+
+
+class InferenceScheduler:
+    """
+    Очередь с приоритетами (heapq) на все сессии процесса:
+    - на сессию не больше одного ожидающего запроса: повторные сливаются,
+      приоритет берётся наивысший, причины копятся;
+    - тревожные и плановые запросы одной сессии — не чаще min_interval_sec после
+      начала прошлого вызова: они ждут срока в очереди, а не отбрасываются;
+      ручные — сразу;
+    - одна сессия не считается двумя воркерами одновременно;
+    - workers — сколько вызовов модели идёт параллельно на все сессии.
+    run(key) — корутина, делающая вызов; её результат получают все слитые запросы.
+    """
+
+    def __init__(self, run: Callable[[Hashable], Awaitable[Any]], *, workers: int = 2,
+                 min_interval_sec: float = 60.0):
+        self._run = run
+        self.workers = workers
+        self.min_interval_sec = min_interval_sec
+        self._heap: list = []  # (priority, seq, key); устаревшие записи пропускаются при выборке
+        self._pending: Dict[Hashable, _Pending] = {}
+        self._running: set = set()
+        self._last_run: Dict[Hashable, float] = {}
+        self._seq = itertools.count()
+        self._changed: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        # метрики
+        self.submitted = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.coalesced = 0
+        self.deferred = 0     # запрос отложен до min_interval_sec
+        self.runs = 0
+        self.errors = 0
+        self.wait_total = {name: 0.0 for name in PRIORITY_NAMES.values()}
+        self.wait_max = {name: 0.0 for name in PRIORITY_NAMES.values()}
+        self.started = {name: 0 for name in PRIORITY_NAMES.values()}
+
+    # ---- жизненный цикл ----
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._changed = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for key in list(self._pending):
+            self.forget(key)
+
+    # ---- запросы ----
+
+    def submit(self, key: Hashable, priority: int, reason: str) -> _Pending:
+        """Ставит (или сливает) запрос сессии; не ждёт результата."""
+        now = time.monotonic()
+        if priority == PRIORITY_MANUAL:
+            not_before = now
+        else:
+            not_before = max(now, self._last_run.get(key, float("-inf")) + self.min_interval_sec)
+            if not_before > now:
+                self.deferred += 1
+        self.submitted[PRIORITY_NAMES[priority]] += 1
+
+        p = self._pending.get(key)
+        if p is None:
+            p = self._pending[key] = _Pending(priority, next(self._seq), not_before, now)
+            heapq.heappush(self._heap, (priority, p.seq, key))
+        else:
+            self.coalesced += 1
+            if priority < p.priority or not_before < p.not_before:
+                p.priority = min(p.priority, priority)
+                p.not_before = min(p.not_before, not_before)
+                p.seq = next(self._seq)  # прежняя запись в куче становится устаревшей
+                heapq.heappush(self._heap, (p.priority, p.seq, key))
+        p.reasons.append(reason)
+        if self._changed is not None:
+            self._changed.set()
+        return p
+
+    async def request(self, key: Hashable, priority: int, reason: str) -> Any:
+        """Ставит запрос и ждёт результат вызова, в который он попал."""
+        fut = asyncio.get_running_loop().create_future()
+        self.submit(key, priority, reason).waiters.append(fut)
+        return await fut
+
+    def forget(self, key: Hashable) -> None:
+        """Сессия остановлена: ожидающий запрос снимается, ждущие получают ошибку."""
+        p = self._pending.pop(key, None)
+        if p is not None:
+            for fut in p.waiters:
+                if not fut.done():
+                    fut.set_exception(RuntimeError(f"session {key} stopped"))
+        self._last_run.pop(key, None)
+
+    # ---- выборка и исполнение ----
+
+    def _pop_ready(self, now: float):
+        """(ключ готового запроса с наивысшим приоритетом, через сколько проверить снова)."""
+        skipped = []
+        found = None
+        delay: Optional[float] = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            _, seq, key = entry
+            p = self._pending.get(key)
+            if p is None or p.seq != seq:
+                continue
+            if key in self._running:
+                skipped.append(entry)
+                continue
+            if p.not_before > now:
+                wait = p.not_before - now
+                delay = wait if delay is None else min(delay, wait)
+                skipped.append(entry)
+                continue
+            found = key
+            break
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        return found, delay
+
+    async def _next(self) -> Hashable:
+        while True:
+            key, delay = self._pop_ready(time.monotonic())
+            if key is not None:
+                return key
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._next()
+            p = self._pending.pop(key)
+            now = time.monotonic()
+            name = PRIORITY_NAMES[p.priority]
+            wait = now - p.created
+            self.started[name] += 1
+            self.wait_total[name] += wait
+            self.wait_max[name] = max(self.wait_max[name], wait)
+            self._running.add(key)
+            self._last_run[key] = now
+            self.runs += 1
+            try:
+                result = await self._run(key)
+            except asyncio.CancelledError:
+                for fut in p.waiters:
+                    fut.cancel()
+                raise
+            except Exception as e:
+                self.errors += 1
+                if not p.waiters:
+                    print(f"[scheduler] {key} ({name}: {', '.join(p.reasons)}) failed:", repr(e))
+                for fut in p.waiters:
+                    if not fut.done():
+                        fut.set_exception(e)
+            else:
+                for fut in p.waiters:
+                    if not fut.done():
+                        fut.set_result(result)
+            finally:
+                self._running.discard(key)
+                self._changed.set()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": len(self._pending),
+            "running": len(self._running),
+            "submitted": dict(self.submitted),
+            "coalesced": self.coalesced,
+            "deferred": self.deferred,
+            "runs": self.runs,
+            "errors": self.errors,
+            "avg_wait_sec": {
+                name: self.wait_total[name] / self.started[name] if self.started[name] else 0.0
+                for name in self.started
+            },
+            "max_wait_sec": dict(self.wait_max),
+        }
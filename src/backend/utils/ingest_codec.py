@@ -0,0 +1,89 @@
+import json
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.ws_codec import CHANNELS, MAGIC, decode_binary
+
+# Пакеты /ingest от удалённых мониторов — в тех же форматах, что и кадры /ws:
+#   NDJSON: по пакету на строку {"seq": 17, "bpm": [[t, v], ...], "uterus": [[t, v], ...]}
+#           (совместимо с одиночным событием {"source": "bpm", "time": 12.3, "value": 120.0});
+#   binary: кадр CTG1 (utils/ws_codec.py) с "seq" в заголовке.
+# t — секунды от старта сессии. seq — номер пакета у отправителя: повтор уже принятого
+# номера игнорируется, поэтому пакеты можно пересылать после обрыва связи.
+
+Channels = Dict[str, Tuple[np.ndarray, np.ndarray]]
+
+
+class IngestBatch:
+    __slots__ = ("seq", "channels")
+
+    def __init__(self, seq: Optional[int], channels: Channels):
+        self.seq = seq
+        self.channels = channels
+
+    def __len__(self) -> int:
+        return sum(len(t) for t, _ in self.channels.values())
+
+
+def _finite(t: np.ndarray, v: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # NaN/inf во времени навсегда ломают канал: t >= nan ложно для любой следующей точки
+    if not (np.isfinite(t).all() and np.isfinite(v).all()):
+        raise ValueError("time and value must be finite numbers")
+    return t, v
+
+
+def _columns(points) -> Tuple[np.ndarray, np.ndarray]:
+    a = np.asarray(points, dtype=np.float64)
+    if a.size == 0:
+        return np.empty(0), np.empty(0)
+    if a.ndim != 2 or a.shape[1] != 2:
+        raise ValueError("channel points must be [[t, v], ...]")
+    return _finite(a[:, 0], a[:, 1])
+
+
+def _seq(obj: dict) -> Optional[int]:
+    seq = obj.get("seq")
+    return None if seq is None else int(seq)
+
+
+def batch_from_json(obj: dict) -> IngestBatch:
+    if "source" in obj:  # одиночное событие
+        if obj["source"] not in CHANNELS:
+            raise ValueError(f"unknown source {obj['source']!r}")
+        t = np.array([float(obj["time"])])
+        v = np.array([float(obj["value"])])
+        return IngestBatch(_seq(obj), {obj["source"]: _finite(t, v)})
+    channels = {name: _columns(obj[name]) for name in CHANNELS if name in obj}
+    return IngestBatch(_seq(obj), channels)
+
+
+def parse_ndjson(body: bytes) -> List[IngestBatch]:
+    out = []
+    for line in body.splitlines():
+        if line.strip():
+            obj = json.loads(line)
+            if not isinstance(obj, dict):
+                raise ValueError("each NDJSON line must be an object")
+            out.append(batch_from_json(obj))
+    return out
+
+
+def parse_binary(body: bytes) -> IngestBatch:
+    # обрезанный кадр — ошибка клиента (400), а не struct.error из decode_binary
+    if len(body) < 8:
+        raise ValueError("binary frame is shorter than its header")
+    (hlen,) = struct.unpack_from("<I", body, 4)
+    if 8 + hlen > len(body):
+        raise ValueError("binary frame header exceeds body")
+    msg = decode_binary(body)
+    channels = {name: _finite(msg[name][:, 0], msg[name][:, 1]) for name in CHANNELS if name in msg}
+    return IngestBatch(_seq(msg), channels)
+
+
+def parse_body(body: bytes) -> List[IngestBatch]:
+    """Тело запроса или сообщение WS: бинарный кадр (по MAGIC) или NDJSON."""
+    if body[:4] == MAGIC:
+        return [parse_binary(body)]
+    return parse_ndjson(body)
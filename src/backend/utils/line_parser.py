@@ -0,0 +1,67 @@
+from typing import List, Tuple
+
+import numpy as np
+
+_EMPTY = np.empty(0, dtype=np.float64)
+
+
+class LineParser:
+    """
+    Разбор потока строк вида "<число>\\n" кусками: feed() принимает очередной
+    прочитанный кусок и возвращает значения всех завершённых в нём строк.
+    Незавершённый хвост хранится до следующего куска. Каждый кусок разбирается
+    за один проход (split + векторное преобразование), без перестройки буфера на
+    каждую строку.
+    """
+
+    def __init__(self, max_line: int = 256):
+        self._rest = b""
+        self.max_line = max_line  # хвост длиннее — мусор в потоке, отбрасываем
+        self.bad_lines = 0
+
+    def feed(self, chunk: bytes) -> np.ndarray:
+        data = self._rest + chunk if self._rest else bytes(chunk)
+        lines = data.split(b"\n")
+        self._rest = lines.pop()
+        if len(self._rest) > self.max_line:
+            self._rest = b""
+            self.bad_lines += 1
+        if not lines:
+            return _EMPTY
+        return self._parse(lines)
+
+    def _parse(self, lines: List[bytes]) -> np.ndarray:
+        try:
+            # float() и numpy сами отбрасывают пробелы и \r по краям
+            return np.array(lines).astype(np.float64)
+        except ValueError:
+            pass
+        out = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                out.append(float(line))
+            except ValueError:
+                self.bad_lines += 1
+        return np.asarray(out, dtype=np.float64)
+
+
+def spread_times(n: int, t_lo: float, t_hi: float) -> np.ndarray:
+    """
+    Времена n отсчётов, пришедших одним куском за интервал (t_lo, t_hi]:
+    равномерно, последний — в t_hi (момент чтения).
+    """
+    if n <= 0:
+        return _EMPTY
+    return t_lo + (t_hi - t_lo) * np.arange(1, n + 1, dtype=np.float64) / n
+
+
+def chunk_times(n: int, t_prev: float, t_read_start: float, t_read_end: float) -> Tuple[np.ndarray, float]:
+    """
+    Интерполяция времён для куска, прочитанного за [t_read_start, t_read_end]:
+    отсчёты не могли прийти раньше начала чтения и раньше предыдущего куска.
+    Возвращает (времена, время последнего отсчёта).
+    """
+    t = spread_times(n, max(t_prev, t_read_start), t_read_end)
+    return t, (float(t[-1]) if n else t_prev)
@@ -0,0 +1,321 @@
+import asyncio
+import random
+import time
+from collections import Counter
+from typing import Dict, Hashable, List, Optional, Sequence, Union
+from urllib.parse import urlsplit
+
+import httpx
+
+# Клиент model_api: один на процесс (пул соединений с keep-alive), общий дедлайн
+# на вызов, повторы с джиттером, предохранитель (circuit breaker) и выбор
+# реплики по загрузке и готовности.
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+class BreakerOpen(Exception):
+    """Вызов не делался: предохранитель разомкнут."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """
+    closed → open после failure_threshold неудачных вызовов подряд;
+    через reset_sec — half_open: пропускается один пробный вызов,
+    успех замыкает цепь, неудача снова размыкает.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_sec: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_sec = reset_sec
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.last_error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_sec:
+            return "half_open"
+        return "open"
+
+    def check(self) -> None:
+        """Бросает BreakerOpen, если вызов сейчас делать нельзя."""
+        state = self.state
+        if state == "open":
+            left = self.reset_sec - (time.monotonic() - self.opened_at)
+            raise BreakerOpen(f"circuit open for {left:.0f}s more after {self.failures} failures: {self.last_error}")
+        if state == "half_open":
+            if self.probing:
+                raise BreakerOpen("circuit half-open, probe in flight")
+            self.probing = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self, error: str) -> None:
+        self.failures += 1
+        self.last_error = error
+        if self.probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+
+class Replica:
+    """Один экземпляр model_api: свой предохранитель, запросы в работе и готовность по /health."""
+
+    def __init__(self, url: str, breaker: CircuitBreaker):
+        self.url = url
+        self.health_url = urlsplit(url)._replace(path="/health", query="", fragment="").geturl()
+        self.breaker = breaker
+        self.healthy = True  # до первой проверки считаем готовым
+        self.last_health_error: Optional[str] = None
+        self.in_flight = 0
+        self.attempts = 0
+        self.failures = 0
+        self.last_latency = 0.0
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and self.breaker.state != "open"
+
+    def stats(self, sessions: int) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "last_health_error": self.last_health_error,
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "last_error": self.breaker.last_error,
+            "in_flight": self.in_flight,
+            "sessions": sessions,
+            "attempts": self.attempts,
+            "failures": self.failures,
+            "last_latency_sec": self.last_latency,
+        }
+
+
+class ModelClient:
+    """
+    POST в model_api через общий httpx.AsyncClient.
+    deadline_sec ограничивает вызов целиком (все попытки и паузы),
+    attempt_timeout_sec — одну попытку. Повторяются сетевые ошибки, таймауты
+    и ответы 502/503/504; пауза — экспоненциальная с полным джиттером.
+
+    urls — одна или несколько реплик. Вызов идёт на наименее загруженную
+    (запросы в работе, затем закреплённые сессии) из готовых: /health отвечает
+    и предохранитель реплики не разомкнут. Вызов с key (сессия) закрепляется за
+    репликой и идёт туда же, пока она готова; иначе — на другую (failover).
+    Повтор после неудачи идёт на ещё не пробованную реплику, если такая есть.
+    """
+
+    def __init__(self, urls: Union[str, Sequence[str]], *, attempt_timeout_sec: float = 20.0,
+                 deadline_sec: float = 45.0, retries: int = 2, backoff_sec: float = 0.5,
+                 backoff_max_sec: float = 5.0, breaker_failures: int = 3, breaker_reset_sec: float = 60.0,
+                 max_connections: int = 20, health_interval_sec: float = 10.0,
+                 health_timeout_sec: float = 2.0):
+        urls = [urls] if isinstance(urls, str) else list(urls)
+        if not urls:
+            raise ValueError("at least one model api url is required")
+        self.replicas: List[Replica] = [
+            Replica(url, CircuitBreaker(breaker_failures, breaker_reset_sec)) for url in urls
+        ]
+        self.attempt_timeout_sec = attempt_timeout_sec
+        self.deadline_sec = deadline_sec
+        self.retries = retries
+        self.backoff_sec = backoff_sec
+        self.backoff_max_sec = backoff_max_sec
+        self.health_interval_sec = health_interval_sec
+        self.health_timeout_sec = health_timeout_sec
+        self._client = httpx.AsyncClient(
+            timeout=attempt_timeout_sec,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self._sticky: Dict[Hashable, Replica] = {}
+        self._health_task: Optional[asyncio.Task] = None
+        # метрики
+        self.calls = 0
+        self.attempts = 0
+        self.failures = 0
+        self.failovers = 0
+        self.skipped = 0
+        self.last_skip_reason: Optional[str] = None
+        self.last_latency = 0.0
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max_sec, self.backoff_sec * 2 ** attempt))
+
+    # ---- выбор реплики ----
+
+    def _pick(self, key: Optional[Hashable], tried: set) -> Replica:
+        """Реплика для очередной попытки; BreakerOpen, если звать некого."""
+        # готовые; если /health не отвечает нигде — хотя бы с замкнутым предохранителем
+        ready = [r for r in self.replicas if r.available] or \
+                [r for r in self.replicas if r.breaker.state != "open"]
+        fresh = [r for r in ready if r not in tried] or ready
+        load = Counter(self._sticky.values())
+        order = sorted(fresh, key=lambda r: (r.in_flight, load[r]))
+        current = self._sticky.get(key) if key is not None else None
+        if current in order:
+            order.remove(current)
+            order.insert(0, current)
+        for r in order:
+            try:
+                r.breaker.check()
+            except BreakerOpen:
+                continue
+            if key is not None and current is not r:
+                if current is not None:
+                    self.failovers += 1
+                self._sticky[key] = r
+            return r
+        reasons = "; ".join(f"{r.url}: {r.last_health_error or r.breaker.last_error or r.breaker.state}"
+                            for r in self.replicas)
+        raise BreakerOpen(f"no model api replica available ({reasons})")
+
+    def replica_of(self, key: Hashable) -> Optional[str]:
+        r = self._sticky.get(key)
+        return r.url if r is not None else None
+
+    def forget(self, key: Hashable) -> None:
+        """Сессия остановлена: снимаем закрепление."""
+        self._sticky.pop(key, None)
+
+    # ---- вызов ----
+
+    async def post(self, *, key: Optional[Hashable] = None, **kwargs) -> httpx.Response:
+        """
+        Как httpx.AsyncClient.post(url, **kwargs) с повторами. Тело должно быть
+        переиспользуемым (bytes, а не открытые файлы), т.к. попыток может быть несколько.
+        key — ключ закрепления за репликой (id сессии).
+        """
+        try:
+            r = self._pick(key, set())
+        except BreakerOpen as e:
+            self.skipped += 1
+            self.last_skip_reason = e.reason
+            raise
+
+        self.calls += 1
+        started = time.monotonic()
+        deadline = started + self.deadline_sec
+        failed: Dict[Replica, str] = {}  # реплики, не ответившие в этом вызове
+        attempt = 0
+
+        def settle(ok: Optional[Replica]) -> None:
+            # предохранитель каждой реплики считает вызовы, а не попытки
+            for rep, err in failed.items():
+                if rep is not ok:
+                    rep.breaker.record_failure(err)
+            if ok is not None:
+                ok.breaker.record_success()
+
+        while True:
+            remaining = deadline - time.monotonic()
+            self.attempts += 1
+            cur = r
+            cur.attempts += 1
+            cur.in_flight += 1
+            attempt_started = time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise httpx.TimeoutException("model api deadline exceeded")
+                resp = await asyncio.wait_for(
+                    self._client.post(r.url, timeout=min(self.attempt_timeout_sec, remaining), **kwargs),
+                    timeout=remaining,
+                )
+                if resp.status_code in RETRY_STATUSES:
+                    resp.raise_for_status()
+            except (httpx.TransportError, httpx.HTTPStatusError, asyncio.TimeoutError) as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    e = httpx.TimeoutException("model api deadline exceeded")
+                r.failures += 1
+                failed[r] = f"{type(e).__name__}: {e}"
+                pause = self._backoff(attempt)
+                if attempt >= self.retries or time.monotonic() + pause >= deadline:
+                    self.failures += 1
+                    settle(None)
+                    raise e
+                attempt += 1
+                await asyncio.sleep(pause)
+                try:
+                    r = self._pick(key, set(failed))
+                except BreakerOpen:
+                    self.failures += 1
+                    settle(None)
+                    raise e
+                continue
+            except asyncio.CancelledError:
+                for rep in {r, *failed}:
+                    rep.breaker.probing = False
+                raise
+            except Exception as e:
+                self.failures += 1
+                r.failures += 1
+                failed[r] = f"{type(e).__name__}: {e}"
+                settle(None)
+                raise
+            finally:
+                cur.in_flight -= 1
+            settle(r)
+            r.last_latency = time.monotonic() - attempt_started
+            self.last_latency = time.monotonic() - started
+            return resp
+
+    # ---- готовность реплик ----
+
+    async def _check_health(self, r: Replica) -> None:
+        try:
+            resp = await self._client.get(r.health_url, timeout=self.health_timeout_sec)
+            ok = resp.status_code == 200 and resp.json().get("status") == "ok"
+            r.healthy = ok
+            r.last_health_error = None if ok else f"health: HTTP {resp.status_code}"
+        except Exception as e:
+            r.healthy = False
+            r.last_health_error = f"health: {type(e).__name__}: {e}"
+
+    async def health_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(self._check_health(r) for r in self.replicas))
+            await asyncio.sleep(self.health_interval_sec)
+
+    def start(self) -> None:
+        """Фоновая проверка /health реплик (в работающем цикле событий)."""
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self.health_loop())
+
+    @property
+    def state(self) -> str:
+        states = {r.breaker.state for r in self.replicas if r.healthy} or {"open"}
+        for state in ("closed", "half_open"):
+            if state in states:
+                return state
+        return "open"
+
+    def stats(self) -> dict:
+        load = Counter(self._sticky.values())
+        return {
+            "state": self.state,
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "failures": self.failures,
+            "failovers": self.failovers,
+            "skipped": self.skipped,
+            "last_skip_reason": self.last_skip_reason,
+            "last_latency_sec": self.last_latency,
+            "replicas": [r.stats(load[r]) for r in self.replicas],
+        }
+
+    async def aclose(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await self._client.aclose()
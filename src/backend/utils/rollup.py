@@ -0,0 +1,80 @@
+from typing import Dict, Sequence
+
+import numpy as np
+
+# уровни сводок, сек: бакет уровня L — отсчёты с floor(t / L) == bucket
+ROLLUP_LEVELS = (1, 10, 60)
+
+
+def _empty() -> Dict[str, np.ndarray]:
+    # храним сумму, а не среднее: mean = vsum / n, и бакеты складываются без потерь
+    return {
+        "bucket": np.empty(0, dtype=np.int64),
+        "n": np.empty(0, dtype=np.int64),
+        "vmin": np.empty(0, dtype=np.float64),
+        "vmax": np.empty(0, dtype=np.float64),
+        "vsum": np.empty(0, dtype=np.float64),
+    }
+
+
+def _reduce(keys: np.ndarray, n: np.ndarray, vmin: np.ndarray, vmax: np.ndarray,
+            vsum: np.ndarray) -> Dict[str, np.ndarray]:
+    """Схлопывает подряд идущие строки с одинаковым ключом (ключи неубывающие)."""
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return {
+        "bucket": keys[starts],
+        "n": np.add.reduceat(n, starts),
+        "vmin": np.minimum.reduceat(vmin, starts),
+        "vmax": np.maximum.reduceat(vmax, starts),
+        "vsum": np.add.reduceat(vsum, starts),
+    }
+
+
+def bucket_stats(points: np.ndarray, level: float) -> Dict[str, np.ndarray]:
+    """
+    min/max/sum/count отсчётов (N, 2) по бакетам длины level секунд.
+    Время предполагается неубывающим. Сводки соседних кусков одного бакета
+    складываются (n, vsum — суммой, vmin/vmax — min/max), так что их можно
+    строить по мере поступления данных.
+    """
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(pts) == 0:
+        return _empty()
+    t, v = pts[:, 0], pts[:, 1]
+    keys = np.floor(t / level).astype(np.int64)
+    return _reduce(keys, np.ones(len(v), dtype=np.int64), v, v, v)
+
+
+def merge_buckets(stats: Dict[str, np.ndarray], factor: int) -> Dict[str, np.ndarray]:
+    """Укрупняет бакеты в factor раз (bucket // factor)."""
+    if factor <= 1 or len(stats["bucket"]) == 0:
+        return stats
+    keys = np.floor_divide(stats["bucket"], factor)
+    return _reduce(keys, stats["n"], stats["vmin"], stats["vmax"], stats["vsum"])
+
+
+def choose_level(span: float, points: int, raw_count: int,
+                 levels: Sequence[int] = ROLLUP_LEVELS) -> int:
+    """
+    Уровень детализации для диапазона длиной span сек: 0 — сырые отсчёты, если их
+    не больше points, иначе самый мелкий уровень, у которого бакетов не больше points
+    (или самый крупный, если не подходит ни один).
+    """
+    if raw_count <= points:
+        return 0
+    for level in levels:
+        if span / level <= points:
+            return level
+    return levels[-1]
+
+
+def to_series(stats: Dict[str, np.ndarray], level: float) -> Dict[str, list]:
+    """Столбцы для ответа API: начало бакета, min, max, mean, число отсчётов."""
+    n = stats["n"]
+    return {
+        "t": (stats["bucket"] * level).astype(np.float64).tolist(),
+        "min": stats["vmin"].tolist(),
+        "max": stats["vmax"].tolist(),
+        "mean": (stats["vsum"] / np.maximum(n, 1)).tolist(),
+        "n": n.tolist(),
+    }
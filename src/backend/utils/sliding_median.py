@@ -0,0 +1,90 @@
+import heapq
+import itertools
+from typing import Dict, List, Set, Tuple
+
+# Медиана скользящего окна за O(log w) на добавление/удаление: две кучи
+# (нижняя половина — max-куча на отрицаниях, верхняя — min-куча) с ленивым удалением.
+# Каждый элемент получает номер; удаление только помечает номер, а сам элемент
+# выбрасывается, когда оказывается на вершине кучи. Мусор глубже вершины вычищается
+# перестройкой, как только его больше, чем живых элементов, — O(w) раз в ~w операций.
+
+
+class SlidingMedian:
+    """
+    Мультимножество чисел с медианой: add/remove — O(log w) амортизированно,
+    median — O(1). add() возвращает номер элемента, remove() принимает его.
+    Для чётного размера медиана — среднее двух средних, как и на отсортированном списке.
+    """
+
+    def __init__(self):
+        self._lo: List[Tuple[float, int]] = []  # (-x, номер): нижняя половина, максимум на вершине
+        self._hi: List[Tuple[float, int]] = []  # (x, номер): верхняя половина
+        self._in_lo: Dict[int, bool] = {}       # живые номера → лежит ли в _lo
+        self._dead: Set[int] = set()            # удалённые, но ещё лежащие в кучах
+        self._n_lo = 0
+        self._n_hi = 0
+        self._ids = itertools.count()
+
+    def __len__(self) -> int:
+        return self._n_lo + self._n_hi
+
+    def add(self, x: float) -> int:
+        i = next(self._ids)
+        if not self._n_lo or x <= -self._lo[0][0]:
+            heapq.heappush(self._lo, (-x, i))
+            self._in_lo[i] = True
+            self._n_lo += 1
+        else:
+            heapq.heappush(self._hi, (x, i))
+            self._in_lo[i] = False
+            self._n_hi += 1
+        self._rebalance()
+        return i
+
+    def remove(self, i: int) -> None:
+        if self._in_lo.pop(i):
+            self._n_lo -= 1
+        else:
+            self._n_hi -= 1
+        self._dead.add(i)
+        self._prune()
+        self._rebalance()
+        if len(self._dead) > len(self) + 64:
+            self._rebuild()
+
+    def median(self) -> float:
+        if self._n_lo > self._n_hi:
+            return -self._lo[0][0]
+        return 0.5 * (-self._lo[0][0] + self._hi[0][0])
+
+    # ---- внутреннее ----
+
+    def _prune(self) -> None:
+        for heap in (self._lo, self._hi):
+            while heap and heap[0][1] in self._dead:
+                self._dead.discard(heapq.heappop(heap)[1])
+
+    def _rebalance(self) -> None:
+        # живые размеры: n_lo == n_hi или n_lo == n_hi + 1; вершины после _prune живые
+        if self._n_lo > self._n_hi + 1:
+            v, i = heapq.heappop(self._lo)
+            heapq.heappush(self._hi, (-v, i))
+            self._in_lo[i] = False
+            self._n_lo -= 1
+            self._n_hi += 1
+        elif self._n_lo < self._n_hi:
+            v, i = heapq.heappop(self._hi)
+            heapq.heappush(self._lo, (-v, i))
+            self._in_lo[i] = True
+            self._n_hi -= 1
+            self._n_lo += 1
+        else:
+            return
+        self._prune()
+
+    def _rebuild(self) -> None:
+        self._lo = [e for e in self._lo if e[1] not in self._dead]
+        self._hi = [e for e in self._hi if e[1] not in self._dead]
+        heapq.heapify(self._lo)
+        heapq.heapify(self._hi)
+        self._dead.clear()
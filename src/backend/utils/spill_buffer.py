@@ -0,0 +1,207 @@
+import bisect
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from utils.stream_buffer import ChannelBuffer
+
+# Канал с неограниченной историей при ограниченной памяти:
+#   - хвост последних tail_sec секунд — в ChannelBuffer (как и раньше, срезы без копий);
+#   - всё, что старше, блоками не меньше spill_block точек дописывается в файлы
+#     сегментов <name>-NNNNN.f8 (сырые little-endian float64 пары t, v, только append)
+#     и читается через np.memmap.
+# Абсолютные индексы сквозные по обоим ярусам, поэтому slice_abs/window/abs_index
+# работают одинаково независимо от того, где лежат точки.
+# trim_before отбрасывает начало истории: целые сегменты удаляются с диска,
+# остаток первого сегмента просто пропускается при чтении.
+
+SEGMENT_POINTS = 1 << 20  # точек в одном файле (16 МБ)
+_DTYPE = np.dtype("<f8")
+
+
+class _Segment:
+    __slots__ = ("path", "first", "n", "t_last", "_mm", "_mm_n")
+
+    def __init__(self, path: str, first: int):
+        self.path = path
+        self.first = first   # абсолютный индекс первой точки
+        self.n = 0
+        self.t_last = float("-inf")
+        self._mm: Optional[np.memmap] = None
+        self._mm_n = 0
+
+    def points(self) -> np.ndarray:
+        """Все точки сегмента (N, 2) — memmap только для чтения, переоткрывается после дозаписи."""
+        if self._mm is None or self._mm_n != self.n:
+            self._mm = np.memmap(self.path, dtype=_DTYPE, mode="r", shape=(self.n, 2))
+            self._mm_n = self.n
+        return self._mm
+
+
+class SpillBuffer:
+    """
+    Канал из двух ярусов: хвост в памяти (ChannelBuffer) и сегменты на диске.
+    Память ограничена tail_sec секундами плюс spill_block точками, сколько бы
+    ни длилась сессия. Время предполагается неубывающим, как и в ChannelBuffer.
+
+    slice_abs/window отдают срез без копирования, если диапазон целиком в одном
+    ярусе (в одном сегменте), иначе — склейку частей.
+    """
+
+    def __init__(self, directory: str, name: str, *, tail_sec: float,
+                 spill_block: int = 4096, segment_points: int = SEGMENT_POINTS):
+        self.directory = directory
+        self.name = name
+        self.tail_sec = tail_sec
+        self.spill_block = spill_block
+        self.segment_points = segment_points
+        self.tail = ChannelBuffer()
+        self._segments: List[_Segment] = []
+        self._firsts: List[int] = []     # first сегментов — для поиска по индексу
+        self._t_lasts: List[float] = []  # t_last сегментов — для бинарного поиска по времени
+        self._spilled = 0    # абсолютный индекс первой точки хвоста: левее — диск или отброшенное
+        self._first = 0      # абсолютный индекс первой хранимой точки (после trim_before)
+        self._seg_no = 0     # номер следующего файла сегмента
+
+    # ---- запись ----
+
+    def append(self, t: float, v: float) -> None:
+        self.tail.append(t, v)
+        self._maybe_spill()
+
+    def extend(self, t: np.ndarray, v: np.ndarray) -> None:
+        self.tail.extend(t, v)
+        self._maybe_spill()
+
+    def _maybe_spill(self) -> None:
+        if not len(self.tail):
+            return
+        first = self._spilled
+        n_old = self.tail.abs_index(self.tail.last_time() - self.tail_sec) - first
+        if n_old < self.spill_block:
+            return
+        self._write(self.tail.slice_abs(first, first + n_old))
+        self.tail.drop_first(n_old)
+
+    def _write(self, pts: np.ndarray) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        while len(pts):
+            seg = self._segments[-1] if self._segments else None
+            if seg is None or seg.n >= self.segment_points:
+                path = os.path.join(self.directory, f"{self.name}-{self._seg_no:05d}.f8")
+                self._seg_no += 1
+                seg = _Segment(path, self._spilled)
+                self._segments.append(seg)
+                self._firsts.append(seg.first)
+                self._t_lasts.append(seg.t_last)
+            part = pts[:self.segment_points - seg.n]
+            with open(seg.path, "ab") as f:
+                f.write(np.ascontiguousarray(part, dtype=_DTYPE).tobytes())
+            seg.n += len(part)
+            seg.t_last = float(part[-1, 0])
+            self._t_lasts[-1] = seg.t_last
+            self._spilled += len(part)
+            pts = pts[len(part):]
+
+    def trim_before(self, t_min: float) -> None:
+        """Отбрасывает точки со временем < t_min; сегменты, ставшие ненужными, удаляются."""
+        self._first = max(self._first, self.abs_index(t_min))
+        while self._segments and self._segments[0].first + self._segments[0].n <= self._first:
+            seg = self._segments.pop(0)
+            self._firsts.pop(0)
+            self._t_lasts.pop(0)
+            seg._mm = None
+            try:
+                os.remove(seg.path)
+            except OSError:
+                pass
+        if self._first > self._spilled:
+            self.tail.drop_first(self._first - self._spilled)
+            self._spilled = self._first
+
+    # ---- чтение ----
+
+    def __len__(self) -> int:
+        return self.total - self._first
+
+    @property
+    def total(self) -> int:
+        return self.tail.total
+
+    @property
+    def spilled(self) -> int:
+        """Сколько хранимых точек лежит на диске."""
+        return max(0, self._spilled - self._first)
+
+    def last(self) -> Optional[Tuple[float, float]]:
+        if len(self.tail):
+            return self.tail.last()
+        if self._segments:
+            t, v = self._segments[-1].points()[-1]
+            return float(t), float(v)
+        return None
+
+    def last_time(self) -> float:
+        last = self.last()
+        return last[0] if last else 0.0
+
+    def abs_index(self, t: float) -> int:
+        """Абсолютный индекс первой хранимой точки с time >= t (total, если таких нет)."""
+        k = bisect.bisect_left(self._t_lasts, t)  # первый сегмент, где есть время >= t
+        if k == len(self._segments):
+            return self.tail.abs_index(t)
+        seg = self._segments[k]
+        return max(self._first, seg.first + int(np.searchsorted(seg.points()[:, 0], t, side="left")))
+
+    def slice_abs(self, i0: Optional[int] = None, i1: Optional[int] = None) -> np.ndarray:
+        """Срез по абсолютным индексам [i0, i1) из обоих ярусов; отброшенные точки пропускаются."""
+        total = self.total
+        lo = self._first if i0 is None else min(max(i0, self._first), total)
+        hi = total if i1 is None else min(max(i1, lo), total)
+        if lo >= self._spilled or lo == hi:
+            return self.tail.slice_abs(lo, hi)
+        parts = []
+        k = bisect.bisect_right(self._firsts, lo) - 1
+        for seg in self._segments[k:]:
+            if seg.first >= hi:
+                break
+            a, b = max(lo, seg.first), min(hi, seg.first + seg.n)
+            parts.append(seg.points()[a - seg.first:b - seg.first])
+        if hi > self._spilled:
+            parts.append(self.tail.slice_abs(self._spilled, hi))
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def window(self, t_from: Optional[float] = None, t_to: Optional[float] = None) -> np.ndarray:
+        """Точки с t_from <= t <= t_to."""
+        i0 = None if t_from is None else self.abs_index(t_from)
+        i1 = None
+        if t_to is not None:
+            i1 = self.abs_index(np.nextafter(t_to, np.inf))
+        return self.slice_abs(i0, i1)
+
+    def view(self) -> np.ndarray:
+        """Вся хранимая история (копия, если часть уже на диске)."""
+        return self.slice_abs()
+
+    def nbytes(self) -> int:
+        """Память под хвост."""
+        return self.tail.nbytes()
+
+    def disk_bytes(self) -> int:
+        return sum(seg.n for seg in self._segments) * 2 * _DTYPE.itemsize
+
+    def close(self, remove: bool = True) -> None:
+        """Отпускает memmap'ы и (по умолчанию) удаляет файлы сегментов."""
+        for seg in self._segments:
+            seg._mm = None
+        if remove:
+            for seg in self._segments:
+                try:
+                    os.remove(seg.path)
+                except OSError:
+                    pass
+            try:
+                os.rmdir(self.directory)
+            except OSError:
+                pass  # в каталоге сессии ещё второй канал
@@ -0,0 +1,141 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+# начальная ёмкость канала: ~10 минут при 4–8 Гц
+DEFAULT_CAPACITY = 4096
+
+
+class ChannelBuffer:
+    """
+    Буфер одного канала на предвыделенном массиве (N, 2): столбцы time, value.
+
+    - append/extend — амортизированно O(1), массив растёт геометрически;
+    - поиск по времени — бинарный (время предполагается неубывающим);
+    - view()/window() отдают срезы без копирования (только для чтения).
+
+    Записи идут только за текущий конец, а рост и сжатие выделяют новый массив,
+    поэтому ранее выданные срезы остаются согласованными.
+
+    maxlen — ограниченный режим: хранится не больше maxlen последних точек.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, *, maxlen: Optional[int] = None,
+                 dtype=np.float64):
+        cap = max(16, int(capacity if maxlen is None else min(capacity, maxlen)))
+        self._data = np.empty((cap, 2), dtype=dtype)
+        self._start = 0
+        self._end = 0
+        self._base = 0  # абсолютный индекс точки _data[0]
+        self.maxlen = maxlen
+
+    # ---- запись ----
+
+    def _reserve(self, extra: int) -> None:
+        n = self._end - self._start
+        if self._end + extra <= len(self._data):
+            return
+        need = n + extra
+        cap = len(self._data)
+        # сжимаем без роста, если отброшенный префикс больше половины массива
+        if need > cap // 2:
+            while cap < need + need // 2:
+                cap *= 2
+        new = np.empty((cap, 2), dtype=self._data.dtype)
+        new[:n] = self._data[self._start:self._end]
+        self._data = new
+        self._base += self._start
+        self._start, self._end = 0, n
+
+    def append(self, t: float, v: float) -> None:
+        if self._end == len(self._data):
+            self._reserve(1)
+        self._data[self._end] = (t, v)
+        self._end += 1
+        if self.maxlen is not None and self._end - self._start > self.maxlen:
+            self._start += 1
+
+    def extend(self, t: np.ndarray, v: np.ndarray) -> None:
+        """Пакетное добавление точек (массивы одинаковой длины)."""
+        t = np.asarray(t, dtype=np.float64)
+        n = len(t)
+        if n == 0:
+            return
+        self._reserve(n)
+        self._data[self._end:self._end + n, 0] = t
+        self._data[self._end:self._end + n, 1] = v
+        self._end += n
+        if self.maxlen is not None and self._end - self._start > self.maxlen:
+            self._start = self._end - self.maxlen
+
+    def trim_before(self, t_min: float) -> None:
+        """Отбрасывает точки со временем < t_min (сдвиг начала, без копирования)."""
+        self._start += int(np.searchsorted(self.times, t_min, side="left"))
+
+    def drop_first(self, n: int) -> None:
+        """Отбрасывает n самых старых точек (сдвиг начала, без копирования)."""
+        self._start = min(self._end, self._start + max(0, n))
+
+    def clear(self) -> None:
+        self._base += self._end
+        self._start = self._end = 0
+
+    # ---- чтение ----
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    @property
+    def total(self) -> int:
+        """Сколько точек добавлено за всё время (абсолютный индекс следующей точки)."""
+        return self._base + self._end
+
+    def view(self) -> np.ndarray:
+        """Все хранимые точки: срез (N, 2) без копирования."""
+        v = self._data[self._start:self._end]
+        v.flags.writeable = False
+        return v
+
+    @property
+    def times(self) -> np.ndarray:
+        return self._data[self._start:self._end, 0]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._data[self._start:self._end, 1]
+
+    def last(self) -> Optional[Tuple[float, float]]:
+        if self._end == self._start:
+            return None
+        t, v = self._data[self._end - 1]
+        return float(t), float(v)
+
+    def last_time(self) -> float:
+        return float(self._data[self._end - 1, 0]) if self._end > self._start else 0.0
+
+    def index_range(self, t_from: Optional[float] = None, t_to: Optional[float] = None) -> Tuple[int, int]:
+        """Индексы [i0, i1) точек с t_from <= t <= t_to — бинарным поиском, O(log n)."""
+        ts = self.times
+        i0 = 0 if t_from is None else int(np.searchsorted(ts, t_from, side="left"))
+        i1 = len(ts) if t_to is None else int(np.searchsorted(ts, t_to, side="right"))
+        return i0, max(i0, i1)
+
+    def abs_index(self, t: float) -> int:
+        """Абсолютный индекс первой хранимой точки с time >= t (total, если таких нет)."""
+        return self._base + self._start + int(np.searchsorted(self.times, t, side="left"))
+
+    def window(self, t_from: Optional[float] = None, t_to: Optional[float] = None) -> np.ndarray:
+        """Точки с t_from <= t <= t_to: срез (N, 2) без копирования."""
+        i0, i1 = self.index_range(t_from, t_to)
+        return self.view()[i0:i1]
+
+    def slice_abs(self, i0: Optional[int] = None, i1: Optional[int] = None) -> np.ndarray:
+        """Срез по абсолютным индексам [i0, i1); уже отброшенные точки пропускаются."""
+        first = self._base + self._start
+        total = self.total
+        lo = first if i0 is None else min(max(i0, first), total)
+        hi = total if i1 is None else min(max(i1, lo), total)
+        return self.view()[lo - first:hi - first]
+
+    def nbytes(self) -> int:
+        return self._data.nbytes
@@ -1,6 +1,10 @@
-from typing import List, Tuple
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+from utils.sliding_median import SlidingMedian
 
 Pair = Tuple[float, float]  # (t_sec, value)
+Episode = Tuple[float, float, float, float, float]  # (start, end, peak_t, peak_value, amplitude)
 
 def ema_time_aware(data: List[Pair], tau_sec: float = 6.0) -> List[Pair]:
     """Экспоненциальное сглаживание с учётом неравномерного шага по времени."""
@@ -120,3 +124,142 @@ def detect_contractions(
 def count_contractions(uterus: List[Pair], **kwargs) -> int:
     """Просто количество схваток."""
     return len(detect_contractions(uterus, **kwargs))
+
+
+def _merge_into(cur: List[float], nx: Episode) -> None:
+    """Слияние эпизода nx в cur — те же правила, что и в detect_contractions."""
+    cur[1] = max(cur[1], nx[1])
+    if nx[3] > cur[3]:
+        cur[2] = nx[2]
+        cur[3] = nx[3]
+        cur[4] = max(cur[4], nx[4])
+
+
+class ContractionDetector:
+    """
+    Потоковый вариант detect_contractions: точки подаются по одной, состояние
+    (EMA, окно базовой линии, открытый эпизод, эпизод в ожидании слияния)
+    хранится между вызовами. Медиана окна базовой линии — на двух кучах
+    (utils/sliding_median.py), O(log w) на точку вместо пересчёта всей истории.
+
+    update() возвращает схватки, которые окончательно закрылись
+    (больше не могут слиться со следующими); count совпадает с
+    count_contractions() по всей поданной истории.
+    """
+
+    def __init__(
+        self,
+        *,
+        tau_sec: float = 6.0,
+        base_win_sec: float = 150.0,
+        th_high: float = 15.0,
+        th_low: float = 15.0,
+        min_dur: float = 25.0,
+        min_amp: float = 8.0,
+        merge_gap: float = 30.0,
+    ):
+        self.tau_sec = tau_sec
+        self.base_win_sec = base_win_sec
+        self.th_high = th_high
+        self.th_low = th_low
+        self.min_dur = min_dur
+        self.min_amp = min_amp
+        self.merge_gap = merge_gap
+
+        self.n = 0
+        self.events: List[Episode] = []  # закрытые и слитые схватки
+        # EMA
+        self._y = 0.0
+        self._t_prev = 0.0
+        # окно базовой линии: (t, номер в медиане) в порядке поступления
+        self._win: Deque[Tuple[float, int]] = deque()
+        self._median = SlidingMedian()
+        # гистерезис
+        self._in_evt = False
+        self._start = self._peak_t = 0.0
+        self._peak = float("-inf")
+        self._base_at_start = 0.0
+        self._t_last = 0.0
+        # последний эпизод, который ещё может слиться со следующим
+        self._pending: Optional[List[float]] = None
+
+    def _baseline(self, t: float, y: float) -> float:
+        self._win.append((t, self._median.add(y)))
+        while len(self._win) > 1 and self._win[0][0] < t - self.base_win_sec:
+            self._median.remove(self._win.popleft()[1])
+        return self._median.median()
+
+    def _close(self, end: float) -> Optional[Episode]:
+        dur = end - self._start
+        amp = self._peak - self._base_at_start
+        if dur >= self.min_dur and amp >= self.min_amp:
+            return (self._start, end, self._peak_t, self._peak, amp)
+        return None
+
+    def update(self, t: float, x: float) -> List[Episode]:
+        """Добавляет точку (t, value); возвращает окончательно закрытые схватки."""
+        if self.n == 0:
+            self._y = x
+        else:
+            dt = max(1e-6, t - self._t_prev)
+            alpha = 1.0 - pow(2.718281828, -dt / self.tau_sec)  # 1 - exp(-dt/tau)
+            self._y = self._y + alpha * (x - self._y)
+        self._t_prev = t
+        self._t_last = t
+        self.n += 1
+        y = self._y
+        b = self._baseline(t, y)
+        d = y - b
+
+        closed: List[Episode] = []
+        if not self._in_evt:
+            if d >= self.th_high:
+                self._in_evt = True
+                self._start = t
+                self._base_at_start = b
+                self._peak = y
+                self._peak_t = t
+        else:
+            if y > self._peak:
+                self._peak = y
+                self._peak_t = t
+            if d <= self.th_low:
+                self._in_evt = False
+                ep = self._close(t)
+                if ep is not None:
+                    if self._pending is not None and ep[0] - self._pending[1] <= self.merge_gap:
+                        _merge_into(self._pending, ep)
+                    else:
+                        if self._pending is not None:
+                            closed.append(tuple(self._pending))
+                        self._pending = list(ep)
+
+        # новый эпизод может начаться не раньше t — ожидающий уже ни с чем не сольётся
+        if (self._pending is not None and not self._in_evt
+                and t - self._pending[1] > self.merge_gap):
+            closed.append(tuple(self._pending))
+            self._pending = None
+
+        self.events.extend(closed)
+        return closed
+
+    def extend(self, points) -> List[Episode]:
+        closed: List[Episode] = []
+        for t, v in points:
+            closed.extend(self.update(t, v))
+        return closed
+
+    @property
+    def count(self) -> int:
+        """Количество схваток с учётом ожидающего и ещё открытого эпизодов."""
+        if self.n < 3:
+            return 0
+        cnt = len(self.events)
+        tail = self._close(self._t_last) if self._in_evt else None
+        if self._pending is not None:
+            cnt += 1
+            if tail is not None and tail[0] - self._pending[1] > self.merge_gap:
+                cnt += 1
+        elif tail is not None:
+            cnt += 1
+        return cnt
@@ -0,0 +1,70 @@
+import json
+import struct
+from typing import Any, Dict, Union
+
+import numpy as np
+
+# Бинарный кадр /ws (little-endian):
+#   MAGIC (4 байта) | uint32 длина заголовка H | JSON-заголовок (H байт, добит пробелами до кратности 4)
+#   | для каждого канала из header["channels"]: float32 t - t0 [n] | float32 value [n]
+# Времена передаются смещениями от t0 (float64 в заголовке), поэтому float32 не теряет точность.
+MAGIC = b"CTG1"
+CHANNELS = ("bpm", "uterus")
+
+FORMAT_JSON = "json"
+FORMAT_BINARY = "binary"
+
+
+def _points(arr: Any) -> np.ndarray:
+    a = np.asarray(arr, dtype=np.float64)
+    return a.reshape(-1, 2) if a.size else np.empty((0, 2), dtype=np.float64)
+
+
+def encode_json(msg: Dict[str, Any]) -> str:
+    """Текстовый кадр: каналы как списки [t, v]."""
+    out = dict(msg)
+    for name in CHANNELS:
+        if name in out:
+            out[name] = _points(out[name]).tolist()
+    return json.dumps(out, ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_binary(msg: Dict[str, Any]) -> bytes:
+    """Бинарный кадр: скаляры в JSON-заголовке, каналы — упакованные float32-столбцы."""
+    header = {k: v for k, v in msg.items() if k not in CHANNELS}
+    columns = []
+    channels = {}
+    for name in CHANNELS:
+        if name not in msg:
+            continue
+        pts = _points(msg[name])
+        t0 = float(pts[0, 0]) if len(pts) else 0.0
+        channels[name] = {"n": len(pts), "t0": t0}
+        columns.append((pts[:, 0] - t0).astype("<f4").tobytes())
+        columns.append(pts[:, 1].astype("<f4").tobytes())
+    header["channels"] = channels
+
+    raw = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    raw += b" " * (-len(raw) % 4)  # выравнивание, чтобы на клиенте читать Float32Array без копии
+    return b"".join([MAGIC, struct.pack("<I", len(raw)), raw, *columns])
+
+
+def decode_binary(buf: bytes) -> Dict[str, Any]:
+    """Обратное преобразование (для клиентов на Python и проверки)."""
+    if buf[:4] != MAGIC:
+        raise ValueError("bad frame magic")
+    (hlen,) = struct.unpack_from("<I", buf, 4)
+    off = 8 + hlen
+    msg = json.loads(buf[8:off].decode("utf-8"))
+    for name, meta in msg.pop("channels").items():
+        n = meta["n"]
+        t = np.frombuffer(buf, dtype="<f4", count=n, offset=off).astype(np.float64) + meta["t0"]
+        off += 4 * n
+        v = np.frombuffer(buf, dtype="<f4", count=n, offset=off).astype(np.float64)
+        off += 4 * n
+        msg[name] = np.column_stack((t, v))
+    return msg
+
+
+def encode_message(msg: Dict[str, Any], fmt: str) -> Union[str, bytes]:
+    return encode_binary(msg) if fmt == FORMAT_BINARY else encode_json(msg)
@@ -64,42 +64,70 @@ export const useWebSocket = ({ url, isActive }: UseWebSocketProps) => {
       setIsConnected(true);
     };
 
+    // Протокол: snapshot (окно + seq) при подключении, далее delta с seq+1
+    // (новые точки и изменившиеся поля). При пропуске seq просим resync.
+    let lastSeq = -1;
+    let windowSeconds = 180;
+
+    const isAlert = (bpm: [number, number][], uterus: [number, number][]) => {
+      const lastBpm = bpm.length ? bpm[bpm.length - 1][1] : undefined;
+      const lastUterus = uterus.length ? uterus[uterus.length - 1][1] : undefined;
+      return (lastBpm !== undefined && (lastBpm > 210 || lastBpm < 100)) ||
+        (lastUterus !== undefined && lastUterus > 80);
+    };
+
+    const appendWindow = (prev: [number, number][], points?: [number, number][]) => {
+      if (!points || !points.length) return prev;
+      const merged = prev.concat(points);
+      const cutoff = merged[merged.length - 1][0] - windowSeconds;
+      let i = 0;
+      while (i < merged.length && merged[i][0] < cutoff) i++;
+      return i ? merged.slice(i) : merged;
+    };
+
     ws.onmessage = (event) => {
       try {
         const message = JSON.parse(event.data);
-        
+
         if (message.type === 'snapshot') {
-          const currentTime = Date.now();
-          
-          if ((message.bpm && (message.bpm[message.bpm.length -1][1] > 210 || message.bpm[message.bpm.length -1][1] < 100)) || (message.uterus && (message.uterus[message.uterus.length -1][1] > 80)) )
-            setData({...data, elapsed: message.elapsed, bpm: message.bpm, uterus: message.uterus, heartRate: message.heartRate, fetalMovement: message.fetalMovement, contractions: message.contractions, alertFlag: true});
-          else
-          setData({...data, elapsed: message.elapsed, bpm: message.bpm, uterus: message.uterus, heartRate: message.heartRate, fetalMovement: message.fetalMovement, contractions: message.contractions, alertFlag: false});
-          setAnalytics(message.analytics)
-          // if (message.bpm && Array.isArray(message.bpm)) {
-          //   const newBpm: WebsData['bpm'] = message.bpm.map((point: [number, number], idx: number) => {
-          //     // const [elapsed] = point;
-          //     // const uterusValue = message.uterus?.[idx]?.[1] || 0;
-          //     const bpmValue = message.bpm?.[idx]?.[1] || 0;
-              
-          //     return {
-          //       timestamp: startTimeRef.current + elapsed * 1000,
-          //       channel1: bpmValue,
-          //       channel2: uterusValue,
-          //       heartRate: bpmValue,
-          //       fetalMovement: 0,
-          //       contractions: 0,
-          //       alertFlag: false
-          //     };
-          //   });
-
-            
-          // }
+          lastSeq = message.seq ?? -1;
+          windowSeconds = message.window_seconds ?? windowSeconds;
+          const bpm = message.bpm ?? [];
+          const uterus = message.uterus ?? [];
+          setData(prev => ({
+            ...prev,
+            elapsed: message.elapsed ?? prev.elapsed,
+            bpm,
+            uterus,
+            heartRate: message.heartRate ?? prev.heartRate,
+            fetalMovement: message.fetalMovement ?? prev.fetalMovement,
+            contractions: message.contractions ?? prev.contractions,
+            alertFlag: isAlert(bpm, uterus),
+          }));
+          if (message.analytics) setAnalytics(message.analytics);
+        } else if (message.type === 'delta') {
+          if (lastSeq >= 0 && message.seq !== lastSeq + 1) {
+            lastSeq = -1;
+            ws.send(JSON.stringify({ type: 'resync' }));
+            return;
+          }
+          lastSeq = message.seq;
+          setData(prev => {
+            const bpm = appendWindow(prev.bpm, message.bpm);
+            const uterus = appendWindow(prev.uterus, message.uterus);
+            return {
+              ...prev,
+              elapsed: message.elapsed ?? prev.elapsed,
+              bpm,
+              uterus,
+              heartRate: message.heartRate ?? prev.heartRate,
+              fetalMovement: message.fetalMovement ?? prev.fetalMovement,
+              contractions: message.contractions ?? prev.contractions,
+              alertFlag: isAlert(bpm, uterus),
+            };
+          });
+          if (message.analytics) setAnalytics(message.analytics);
         }
-
-        // if (message.analytics) {
-        //   setAnalytics(prev => [...prev, ...message.analytics]);
-        // }
       } catch (error) {
         console.error('Error parsing WebSocket message:', error);
       }
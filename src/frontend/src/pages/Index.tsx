@@ -20,7 +20,7 @@ const Index = () => {
 
   // Replace with your actual WebSocket URL
   const { data: wsData, analytics, isConnected } = useWebSocket({
-    url: 'ws://127.0.0.1:8000/ws',
+    url: 'ws://127.0.0.1:8000/ws?points=2000',
     isActive: isSimulationRunning,
   });
 
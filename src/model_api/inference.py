@@ -0,0 +1,54 @@
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+from feature_extraction import extract_features_combined
+from model import load_and_predict
+from evaluate import pretty_print_predictions
+from utils import smooth_signal
+
+
+def predict_signals(
+    fhr_signal: np.ndarray,
+    uterine_signal: np.ndarray,
+    threshold: float = 0.5,
+    smooth: bool = False,
+    smooth_method: str = "moving_average",
+    smooth_window_seconds: int = 5,
+    sampling_rate: int = 4,
+) -> Dict[str, Any]:
+    """
+    Инференс по массивам значений: признаки + CatBoost.
+    Общая часть HTTP /predict и встроенного режима бэкенда (без CSV и сети).
+    Возвращает {"labels": [...], "predictions": {label: {proba, pred}}}.
+    """
+    fhr_signal = np.asarray(fhr_signal, dtype=float)
+    uterine_signal = np.asarray(uterine_signal, dtype=float)
+    fhr_signal = fhr_signal[np.isfinite(fhr_signal)]
+    uterine_signal = uterine_signal[np.isfinite(uterine_signal)]
+    if fhr_signal.size == 0 or uterine_signal.size == 0:
+        raise ValueError("Пустой сигнал: нет валидных значений bpm или uterus")
+
+    if smooth:
+        fhr_signal = smooth_signal(
+            fhr_signal,
+            method=smooth_method,
+            window_seconds=smooth_window_seconds,
+            sampling_rate=sampling_rate,
+        )
+        uterine_signal = smooth_signal(
+            uterine_signal,
+            method=smooth_method,
+            window_seconds=smooth_window_seconds,
+            sampling_rate=sampling_rate,
+        )
+
+    feats = extract_features_combined(fhr_signal, uterine_signal, sampling_rate=sampling_rate)
+    features_df = pd.DataFrame([feats])
+
+    features_df_with_preds, labels = load_and_predict(features_df, threshold=threshold, only_top_categories=True)
+    return {
+        "labels": labels,
+        "predictions": pretty_print_predictions(features_df_with_preds, labels),
+    }
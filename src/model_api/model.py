@@ -128,14 +128,24 @@ def predict_with_models(
     return features_df, labels
 
 
+_MODELS: Dict[bool, Dict[str, CatBoostClassifier]] = {}
+
+
+def get_models(only_top_categories: bool = True) -> Dict[str, CatBoostClassifier]:
+    """Реестр моделей процесса: чекпойнты читаются с диска один раз."""
+    if only_top_categories not in _MODELS:
+        allowed = TOP_CATEGORIES if only_top_categories else None
+        _MODELS[only_top_categories] = load_catboost_models(allowed_labels=allowed)
+    return _MODELS[only_top_categories]
+
+
 def load_and_predict(
     features_df: pd.DataFrame,
     threshold: float = 0.5,
     only_top_categories: bool = True,
 ) -> Tuple[pd.DataFrame, List[str]]:
     """Упрощённый интерфейс: загрузить модели и получить предсказания."""
-    allowed = TOP_CATEGORIES if only_top_categories else None
-    models = load_catboost_models(allowed_labels=allowed)
+    models = get_models(only_top_categories)
     return predict_with_models(features_df.copy(), models, threshold=threshold, ensure_top_order=True)
 
 
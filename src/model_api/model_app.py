@@ -7,10 +7,7 @@ from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
-from feature_extraction import extract_features_combined
-from model import load_and_predict
-from evaluate import pretty_print_predictions
-from utils import smooth_signal
+from inference import predict_signals
 
 
 app = FastAPI(title="Fetal Health CatBoost API")
@@ -73,30 +70,14 @@ async def predict(
         fhr_signal = _read_signal_from_upload(bpm)
         uterine_signal = _read_signal_from_upload(uterus)
 
-        if smooth:
-            fhr_signal = smooth_signal(
-                fhr_signal,
-                method=smooth_method,
-                window_seconds=smooth_window_seconds,
-                sampling_rate=4,
-            )
-            uterine_signal = smooth_signal(
-                uterine_signal,
-                method=smooth_method,
-                window_seconds=smooth_window_seconds,
-                sampling_rate=4,
-            )
-
-        feats = extract_features_combined(fhr_signal, uterine_signal, sampling_rate=4)
-        features_df = pd.DataFrame([feats])
-
-        features_df_with_preds, labels = load_and_predict(features_df, threshold=threshold, only_top_categories=True)
-        result = pretty_print_predictions(features_df_with_preds, labels)
-
-        return JSONResponse({
-            "labels": labels,
-            "predictions": result,
-        })
+        return JSONResponse(predict_signals(
+            fhr_signal,
+            uterine_signal,
+            threshold=threshold,
+            smooth=smooth,
+            smooth_method=smooth_method,
+            smooth_window_seconds=smooth_window_seconds,
+        ))
     except HTTPException:
         raise
     except Exception as e: